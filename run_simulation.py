@@ -1,18 +1,72 @@
 #!/usr/bin/python3
 
+import argparse
+import hashlib
+import importlib.util
 import os
+import subprocess
 import sys
 
-if len(sys.argv) != 3:
-    print("Usage:\tpython3 run_simulation.py [grid_width] [grid_height]")
-    quit()
-else:
-    grid_width = sys.argv[1]
-    grid_height = sys.argv[2]
-    run_cmd = "export PYTHONPATH=$PYTHONPATH:`pwd`:`pwd`/src && python3 src/simulations/gui_simulation.py " + grid_width + " " + grid_height + " > /dev/null"
-
-    print("Checking dependencies...")
-    os.system("pip3 install -r requirements.txt")
-    print("Launching simulation...")
-    print('Press ctrl-c to exit')
-    os.system(run_cmd)
+ROOT = os.path.dirname(os.path.abspath(__file__))
+REQUIREMENTS = os.path.join(ROOT, 'requirements.txt')
+# records the requirements.txt that was last installed, so that later launches can skip pip
+DEPENDENCY_STAMP = os.path.join(ROOT, '.requirements_installed')
+
+
+def check_dependencies():
+    """ Installs the requirements if requirements.txt changed since they were last installed or one of them is missing """
+    with open(REQUIREMENTS, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+
+    modules = []
+    with open(REQUIREMENTS, 'r') as f:
+        for line in f:
+            name = line.split('#')[0].strip()
+            for separator in '<>=!~;[ ':
+                name = name.split(separator)[0]
+            if name:
+                modules.append(name.replace('-', '_'))
+
+    installed = os.path.exists(DEPENDENCY_STAMP) and open(DEPENDENCY_STAMP).read() == digest
+    if installed and all(importlib.util.find_spec(module) is not None for module in modules):
+        return
+
+    print("Installing dependencies...")
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install', '-r', REQUIREMENTS])
+    with open(DEPENDENCY_STAMP, 'w') as f:
+        f.write(digest)
+
+
+if __name__ == '__main__':
+    headless = '--headless' in sys.argv[1:]
+
+    if headless:
+        args = [arg for arg in sys.argv[1:] if arg != '--headless']
+    else:
+        parser = argparse.ArgumentParser(usage="python3 run_simulation.py [grid_width] [grid_height]\n"
+                                               "\tpython3 run_simulation.py --headless [grid_width] [grid_height] [steps] [name=value ...]")
+        parser.add_argument('grid_width', type=int)
+        parser.add_argument('grid_height', type=int)
+        parser.add_argument('--port', type=int)
+        parser.add_argument('--workers', type=int,
+                            help='give every browser tab its own model, run in this many worker processes')
+        parser.add_argument('--max-sessions', type=int, default=40, help='number of tabs served at once with --workers')
+        parser.add_argument('--idle-timeout', type=int, default=600,
+                            help='seconds after which an idle tab is closed with --workers')
+        args = parser.parse_args()
+
+    check_dependencies()
+
+    # run in this process rather than a new interpreter, with the same import paths the PYTHONPATH export used to give
+    sys.path[:0] = [ROOT, os.path.join(ROOT, 'src')]
+
+    if headless:
+        sys.path.insert(0, os.path.join(ROOT, 'src', 'simulations'))
+        import headless_simulation
+        headless_simulation.main(args)
+    else:
+        import egypt_gui
+        print("Launching simulation...")
+        print('Press ctrl-c to exit')
+        egypt_gui.launch(args.grid_width, args.grid_height, port=args.port, workers=args.workers,
+                         max_sessions=args.max_sessions, idle_timeout=args.idle_timeout)
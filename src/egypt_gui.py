@@ -2,9 +2,6 @@ from collections import defaultdict
 
 import numpy as np
 from math import sqrt
-from matplotlib.colors import to_hex
-from matplotlib.cm import ScalarMappable
-from matplotlib.colors import Normalize
 from mesa.visualization.UserParam import UserSettableParameter
 from mesa.visualization.modules import ChartModule
 from mesa.visualization.ModularVisualization import ModularServer, VisualizationElement
@@ -82,13 +79,19 @@ class EgyptGrid(VisualizationElement):
         self.js_code = "elements.push(" + new_element + ");"
 
     def render(self, model):
+        # matplotlib takes a while to import, so it is left until the first frame rather than slowing down the launch
+        from matplotlib.colors import to_hex
+        from matplotlib.cm import ScalarMappable
+        from matplotlib.colors import Normalize
+
+        # the grid only holds the fertility of rasters near settlements, show the whole raster of the last flood instead
+        fertility = model.grid.fertility if model.grid.raster is None else model.grid.raster.rasters[model.grid.raster.current]
+
         # create a mapping from fertility values to colours
-        colour_map = ScalarMappable(norm=Normalize(vmin=-0.5, vmax=np.max(model.grid.fertility) * 1.2), cmap='Greens')
+        colour_map = ScalarMappable(norm=Normalize(vmin=-0.5, vmax=np.max(fertility) * 1.2), cmap='Greens')
 
-        # create list of hex colour strings for each column of the grid
-        colours = []
-        for x in range(self.grid_width):
-            colours.append(to_hex(colour_map.to_rgba(model.grid.fertility[0, x])))
+        # create a hex colour string for each patch of the grid
+        colours = [[to_hex(rgba) for rgba in row] for row in colour_map.to_rgba(np.asarray(fertility))]
 
         grid_state = defaultdict(list)
         for x in range(model.grid.width):
@@ -99,7 +102,7 @@ class EgyptGrid(VisualizationElement):
                     "y": y,
                     "w": 1,
                     "h": 1,
-                    "Color": colours[x],
+                    "Color": colours[y][x],
                     "Filled": "true",
                     "Layer": 0
                 }
@@ -115,8 +118,8 @@ class EgyptGrid(VisualizationElement):
         return grid_state
 
 
-def launch(width, height, port=None):
-    model_params = {
+def model_params(width, height):
+    return {
         'starting_settlements': UserSettableParameter(
             'slider',
             'starting_settlements',
@@ -225,6 +228,8 @@ def launch(width, height, port=None):
         'h': height
     }
 
+
+def visualisation_elements(width, height):
     visualisation_elements = []
 
     # grid visualisation
@@ -267,11 +272,31 @@ def launch(width, height, port=None):
         data_collector_name='datacollector'
     ))
 
-    server = ModularServer(
-        EgyptModel,
-        visualisation_elements,
-        'Egypt Model',
-        model_params
-    )
+    return visualisation_elements
+
+
+def launch(width, height, port=None, workers=None, max_sessions=40, idle_timeout=600):
+    """
+    Launches the GUI. By default all browser tabs share one model stepped by the server itself, given a number of
+    workers every tab gets its own model instead, run in that many worker processes (see egypt_server)
+    """
+    if workers is None:
+        server = ModularServer(
+            EgyptModel,
+            visualisation_elements(width, height),
+            'Egypt Model',
+            model_params(width, height)
+        )
+    else:
+        from egypt_server import SessionServer
+        server = SessionServer(
+            EgyptModel,
+            visualisation_elements(width, height),
+            'Egypt Model',
+            model_params(width, height),
+            workers=workers,
+            max_sessions=max_sessions,
+            idle_timeout=idle_timeout
+        )
 
     server.launch(port)
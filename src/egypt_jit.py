@@ -0,0 +1,59 @@
+import numba
+import numpy as np
+from egypt_kernels import NumpyKernels, EMPTY, FIELD
+
+
+@numba.njit(cache=True)
+def _best_claim(fertility, occupancy, x, y, radius):
+    xmin = max(x - radius, 0)
+    ymin = max(y - radius, 0)
+    xmax = min(x + radius, fertility.shape[1])
+    ymax = min(y + radius, fertility.shape[0])
+    best_x = -1
+    best_y = -1
+    best_fertility = -1.0
+    for field_x in range(xmin, xmax):
+        for field_y in range(ymin, ymax):
+            if (field_x - x) ** 2 + (field_y - y) ** 2 <= radius ** 2:
+                if fertility[field_y, field_x] > best_fertility and occupancy[field_y, field_x] == EMPTY:
+                    best_x = field_x
+                    best_y = field_y
+                    best_fertility = fertility[field_y, field_x]
+    return best_x, best_y, best_fertility
+
+
+@numba.njit(cache=True)
+def _rental_harvests(fertility, occupancy, x, y, radius, competency, distance_cost, max_potential_yield):
+    xmin = max(x - radius, 0)
+    ymin = max(y - radius, 0)
+    xmax = min(x + radius, fertility.shape[1])
+    ymax = min(y + radius, fertility.shape[0])
+    field_xs = np.empty((xmax - xmin) * (ymax - ymin), dtype=np.int64)
+    field_ys = np.empty_like(field_xs)
+    harvests = np.empty(field_xs.size)
+    n = 0
+    for field_x in range(xmin, xmax):
+        for field_y in range(ymin, ymax):
+            if (field_x - x) ** 2 + (field_y - y) ** 2 <= radius ** 2 and occupancy[field_y, field_x] == FIELD:
+                field_xs[n] = field_x
+                field_ys[n] = field_y
+                harvests[n] = fertility[field_y, field_x] * max_potential_yield * competency - \
+                    np.sqrt((field_x - x) ** 2 + (field_y - y) ** 2) * distance_cost
+                n += 1
+    return field_xs[:n], field_ys[:n], harvests[:n]
+
+
+class JitKernels(NumpyKernels):
+    """The neighbourhood scans as loops compiled with numba, which avoids the temporary arrays of the NumPy kernels."""
+
+    name = 'jit'
+
+    def best_claim(self, fertility, occupancy, x, y, radius):
+        best_x, best_y, best_fertility = _best_claim(fertility, occupancy, x, y, radius)
+        if best_fertility <= 0:
+            return None
+        return best_x, best_y
+
+    def rental_harvests(self, fertility, occupancy, x, y, radius, competency, distance_cost, max_potential_yield):
+        return _rental_harvests(fertility, occupancy, x, y, radius, float(competency), float(distance_cost),
+                                float(max_potential_yield))
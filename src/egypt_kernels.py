@@ -0,0 +1,102 @@
+import numpy as np
+
+# values of EgyptGrid.occupancy
+EMPTY = 0
+SETTLEMENT = 1
+FIELD = 2
+
+
+def neighbourhood(x, y, radius, width, height):
+    """
+    Returns the bounds of the knowledge radius around (x, y) as scanned by the household methods, i.e. x - radius up to but
+    excluding x + radius clipped to the grid, and a mask of the cells within the radius indexed [x - xmin, y - ymin]
+    """
+    xmin = max(x - radius, 0)
+    ymin = max(y - radius, 0)
+    xmax = min(x + radius, width)
+    ymax = min(y + radius, height)
+    xs = np.arange(xmin, xmax)
+    ys = np.arange(ymin, ymax)
+    inside = (xs[:, None] - x) ** 2 + (ys[None, :] - y) ** 2 <= radius ** 2
+    return xmin, ymin, xmax, ymax, inside
+
+
+class NumpyKernels():
+    """Vectorised neighbourhood scans and harvest scoring for the household methods.
+
+    Cells are visited in the same x-major order as the reference loops in Household, and every score is computed with
+    the same floating point operations, so the results are identical to the reference implementation.
+    """
+
+    name = 'numpy'
+
+    def best_claim(self, fertility, occupancy, x, y, radius):
+        """ Returns the position of the first most fertile empty cell within the radius, or None if there is no fertile cell """
+        xmin, ymin, xmax, ymax, inside = neighbourhood(x, y, radius, fertility.shape[1], fertility.shape[0])
+        if inside.size == 0:
+            return None
+        candidates = np.where(inside & (occupancy[ymin:ymax, xmin:xmax].T == EMPTY), fertility[ymin:ymax, xmin:xmax].T, -1)
+        best = np.argmax(candidates)
+        if candidates.flat[best] <= 0:
+            return None
+        return xmin + int(best) // candidates.shape[1], ymin + int(best) % candidates.shape[1]
+
+    def field_harvests(self, x, y, field_xs, field_ys, potential_yield, distance_cost):
+        """ Returns the harvest of each of a household's fields, i.e. its potential yield less the cost of the distance travelled """
+        field_xs = np.asarray(field_xs)
+        field_ys = np.asarray(field_ys)
+        return potential_yield - np.sqrt((x - field_xs) ** 2 + (y - field_ys) ** 2) * distance_cost
+
+    def claim_ranking(self, fertility, occupancy, x, y, radius, limit=None):
+        """
+        Returns the x and y positions of the empty fertile cells within the radius, most fertile first and equally fertile
+        cells in scan order, so that the first cell of the ranking that is still empty is the one best_claim would return
+        """
+        xmin, ymin, xmax, ymax, inside = neighbourhood(x, y, radius, fertility.shape[1], fertility.shape[0])
+        field_xs, field_ys = np.nonzero(inside & (occupancy[ymin:ymax, xmin:xmax].T == EMPTY))
+        field_xs += xmin
+        field_ys += ymin
+        values = fertility[field_ys, field_xs]
+        ranking = np.argsort(-values, kind='stable')
+        ranking = ranking[values[ranking] > 0][:limit]
+        return field_xs[ranking], field_ys[ranking]
+
+    def rental_fields(self, fertility, occupancy, x, y, radius):
+        """ Returns the x and y positions, fertility and distance of all fields within the radius, in scan order """
+        xmin, ymin, xmax, ymax, inside = neighbourhood(x, y, radius, fertility.shape[1], fertility.shape[0])
+        field_xs, field_ys = np.nonzero(inside & (occupancy[ymin:ymax, xmin:xmax].T == FIELD))
+        field_xs += xmin
+        field_ys += ymin
+        return field_xs, field_ys, fertility[field_ys, field_xs], np.sqrt((field_xs - x) ** 2 + (field_ys - y) ** 2)
+
+    def rental_harvests(self, fertility, occupancy, x, y, radius, competency, distance_cost, max_potential_yield):
+        """ Returns the x and y positions and harvests of all fields within the radius, in scan order """
+        field_xs, field_ys, field_fertility, distances = self.rental_fields(fertility, occupancy, x, y, radius)
+        return field_xs, field_ys, field_fertility * max_potential_yield * competency - distances * distance_cost
+
+    def prepare(self, model, phase):
+        """ Called by the model before the 'claim' and 'rent' phases of each step, the NumPy kernels need no preparation """
+        pass
+
+
+def get_kernels(name, strips=None):
+    """
+    Returns the kernels for the household methods: 'python' for the reference loops in Household,
+    'numpy' for the vectorised kernels, 'jit' for numba compiled kernels if numba is installed and the NumPy kernels otherwise,
+    or 'strips' for the NumPy kernels split over worker processes that each own a strip of the grid (see egypt_strips)
+    """
+    if name == 'python':
+        return None
+    elif name == 'numpy':
+        return NumpyKernels()
+    elif name == 'jit':
+        # numba is optional and slow to import, so it is only imported when the 'jit' kernels are asked for
+        try:
+            from egypt_jit import JitKernels
+        except ImportError:
+            return NumpyKernels()
+        return JitKernels()
+    elif name == 'strips':
+        from egypt_strips import StripKernels
+        return StripKernels(strips)
+    raise ValueError("unknown kernels '{}', expected 'python', 'numpy', 'jit' or 'strips'".format(name))
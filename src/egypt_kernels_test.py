@@ -0,0 +1,101 @@
+import egypt_kernels
+import egypt_model
+import numpy as np
+import unittest
+
+
+def model_state(model):
+    return [(household.workers, household.grain, household.competency, household.ambition,
+             [field.pos for field in household.fields]) for household in model.households]
+
+
+class TestKernels(unittest.TestCase):
+
+    def assertEquivalent(self, kernels, ticks=40, **parameters):
+        # the kernels must reproduce the reference loops exactly, tick by tick
+        reference = egypt_model.EgyptModel(31, 30, seed=5, **parameters)
+        model = egypt_model.EgyptModel(31, 30, seed=5, kernels=kernels, **parameters)
+        for i in range(ticks):
+            reference.step()
+            model.step()
+            self.assertEqual(model_state(model), model_state(reference))
+
+    def test_numpy(self):
+        self.assertEquivalent('numpy')
+        self.assertEquivalent('numpy', knowledge_radius=5, allow_rental=False)
+        self.assertEquivalent('numpy', ticks=10, knowledge_radius=40, starting_settlements=20, distance_cost=1)
+
+    def test_jit(self):
+        self.assertEquivalent('jit')
+        self.assertEquivalent('jit', knowledge_radius=5, allow_rental=False)
+
+    def test_strips(self):
+        self.assertEquivalent('strips', strips=3)
+        self.assertEquivalent('strips', ticks=10, strips=4, knowledge_radius=40, starting_settlements=20, distance_cost=1)
+
+    def test_strip_of(self):
+        # every row is scanned by the worker whose strip contains it, also where the strips have unequal heights
+        model = egypt_model.EgyptModel(31, 30, seed=1, kernels='strips', strips=4)
+        model.step()
+        kernels = model.kernels
+        for y in range(model.grid.height):
+            ymin, ymax = kernels.bounds[kernels.strip_of(y)]
+            self.assertTrue(ymin <= y < ymax)
+        kernels.close()
+
+    def test_strips_fallback(self):
+        # claim rankings cut short to a single cell run out and are rescanned locally
+        reference = egypt_model.EgyptModel(31, 30, seed=7, starting_settlements=20)
+        model = egypt_model.EgyptModel(31, 30, seed=7, starting_settlements=20, kernels='strips', strips=2)
+        model.kernels.claim_limit = 1
+        for i in range(20):
+            reference.step()
+            model.step()
+            self.assertEqual(model_state(model), model_state(reference))
+        model.kernels.close()
+        for process in model.kernels.processes:
+            self.assertFalse(process.is_alive())
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            egypt_model.EgyptModel(31, 30, kernels='fortran')
+
+    def test_best_claim(self):
+        fertility = np.zeros((10, 12))
+        occupancy = np.zeros((10, 12), dtype=np.int8)
+        for kernels in [egypt_kernels.NumpyKernels(), egypt_kernels.get_kernels('jit')]:
+            self.assertIsNone(kernels.best_claim(fertility, occupancy, 5, 5, 3))
+
+            # equally fertile cells are claimed in x-major scan order
+            fertility[4, 6] = fertility[3, 7] = 1.0
+            self.assertEqual(kernels.best_claim(fertility, occupancy, 5, 5, 3), (6, 4))
+
+            occupancy[4, 6] = egypt_kernels.FIELD
+            self.assertEqual(kernels.best_claim(fertility, occupancy, 5, 5, 3), (7, 3))
+
+            # the scan stops short of x + radius
+            occupancy[3, 7] = egypt_kernels.SETTLEMENT
+            fertility[5, 8] = 2.0
+            self.assertIsNone(kernels.best_claim(fertility, occupancy, 5, 5, 3))
+            self.assertEqual(kernels.best_claim(fertility, occupancy, 5, 5, 4), (8, 5))
+
+            fertility[:] = 0
+            occupancy[:] = egypt_kernels.EMPTY
+
+    def test_occupancy(self):
+        model = egypt_model.EgyptModel(31, 30, starting_settlements=9, starting_households=5, starting_household_size=5, starting_grain=1000)
+        for i in range(10):
+            model.step()
+        for x in range(model.grid.width):
+            for y in range(model.grid.height):
+                agent = model.grid.grid[x][y]
+                if agent is None:
+                    self.assertEqual(model.grid.occupancy[y, x], egypt_kernels.EMPTY)
+                elif isinstance(agent, egypt_model.FieldAgent):
+                    self.assertEqual(model.grid.occupancy[y, x], egypt_kernels.FIELD)
+                else:
+                    self.assertEqual(model.grid.occupancy[y, x], egypt_kernels.SETTLEMENT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,12 @@
 from mesa import Agent, Model
 from mesa.time import RandomActivation
 from mesa.space import SingleGrid
-from mesa.datacollection import DataCollector
 import numpy as np
+import random
 from math import sqrt, pi, e
+from egypt_schedule import OrderedActivation, FallowSchedule
+from egypt_kernels import get_kernels, EMPTY, SETTLEMENT, FIELD
+from egypt_raster import FertilityRaster
 
 # constants in NetLogo source
 PATCH_MAX_POTENTIAL_YIELD = 2475
@@ -48,8 +51,19 @@ def compute_mean_wealth(model):
     return compute_total_wealth(model) / len(model.settlements)
 
 
+# the reporters the validation tools record and compare, by the names they use in their output files
+REPORTERS = [('gini', compute_gini), ('total-population', compute_total_population), ('total-wealth', compute_total_wealth)]
+REPORTER_NAMES = [name for name, reporter in REPORTERS]
+
+
+def compute_reporters(model):
+    return [reporter(model) for name, reporter in REPORTERS]
+
+
 class FieldAgent(Agent):
-    """A field is a piece of land claimed by a household"""
+    """A field is a piece of land claimed by a household.
+    During a model step fallow time is tracked by the model's fallow schedule through the expiry tick,
+    years_fallowed is only kept up to date by changeover()."""
 
     def __init__(self, unique_field_id, model, household):
         super().__init__(unique_field_id, model)
@@ -57,6 +71,14 @@ class FieldAgent(Agent):
         self.household = household
         self.years_fallowed = 0
         self.harvested = False
+        self.expiry = None
+        self.model.fallow_schedule.add(self)
+
+    def harvest(self):
+        """ Marks the field as harvested for this tick and postpones its fallow expiry """
+        self.harvested = True
+        self.years_fallowed = 0
+        self.model.fallow_schedule.harvest(self)
 
     def changeover(self):
         if self.harvested:
@@ -65,12 +87,17 @@ class FieldAgent(Agent):
             self.years_fallowed += 1
 
         if self.years_fallowed >= self.model.fallow_limit:
-            self.household.fields.remove(self)
-            self.model.fields.remove(self)
-            self.model.grid.remove_agent(self)
+            self.release()
 
         self.harvested = False
 
+    def release(self):
+        """ Returns a field that has lain fallow for too long to unclaimed land """
+        self.household.fields.remove(self)
+        self.model.fields.remove(self)
+        self.model.grid.remove_agent(self)
+        self.expiry = None
+
 
 class SettlementAgent(Agent):
     """A settlement that aggregates n households and fields."""
@@ -88,6 +115,7 @@ class SettlementAgent(Agent):
             )
             self.households.append(agent)
             self.model.households.append(agent)
+            self.model.rental_schedule.add(agent)
 
     def workers(self):
         return sum([household.workers for household in self.households])
@@ -100,17 +128,30 @@ class Household():
     """A household that aggregates n workers"""
 
     def __init__(self, starting_size, competency, ambition, starting_grain, settlement):
+        self.settlement = settlement
         self.workers = starting_size
         self.workers_worked = 0
         self.competency = competency
         self.ambition = ambition
         self.grain = starting_grain
-        self.settlement = settlement
         self.generation_changeover_countdown = self.settlement.random.randint(10, 15)
         self.fields = []
 
+    @property
+    def ambition(self):
+        return self._ambition
+
+    @ambition.setter
+    def ambition(self, value):
+        self._ambition = value
+        self.settlement.model.rental_schedule.update(self)
+
     def farm(self):
         """ Increase grain in proportion to field fertility and worker competency """
+        if self.settlement.model.kernels is not None:
+            self.farm_ranked()
+            return
+
         household_x, household_y = self.settlement.pos
         total_harvest = 0
         self.workers_worked = 0
@@ -127,15 +168,43 @@ class Household():
                     best_field = field
                     best_harvest = this_harvest
 
-            farm_chance = self.settlement.random.uniform(0, 1)
+            farm_chance = self.settlement.model.streams['farm'].uniform(0, 1)
             if best_field is not None and (self.grain < (
                     self.workers * ANNUAL_PER_PERSON_GRAIN_CONSUMPTION) or farm_chance < self.ambition * self.competency):
-                best_field.harvested = True
+                best_field.harvest()
                 total_harvest += best_harvest - SEEDING_COST
                 self.workers_worked += 2  # each field = 9.52 feddan. Heqanakht papyri suggest 1 worker per 13 feddan. but Islamic period records 1 worker for every 5 or 6 feddan (Lehner 2000, 310), which is what we are following. Since 'worker' here really means household member, and the assumption is that not all household members (e.g. children, people with other duties) are fulltime labourers, so we went for 2 per field.
 
         self.grain += total_harvest
 
+    def farm_ranked(self):
+        """ Same as farm, but scores all fields once with the model's kernels and ranks them instead of rescanning them for every worker pair """
+        kernels = self.settlement.model.kernels
+        household_x, household_y = self.settlement.pos
+        potential_yield = self.settlement.model.grid.fertility[household_y][household_x] * PATCH_MAX_POTENTIAL_YIELD * self.competency
+        harvests = kernels.field_harvests(household_x, household_y,
+                                          [field.pos[0] for field in self.fields], [field.pos[1] for field in self.fields],
+                                          potential_yield, self.settlement.model.distance_cost)
+        # the scan keeps the first of equally good fields, and only fields with a positive harvest
+        ranking = [(self.fields[i], harvests[i]) for i in np.argsort(-harvests, kind='stable') if harvests[i] > 0]
+
+        total_harvest = 0
+        self.workers_worked = 0
+        best = 0
+        for i in range(self.workers // 2):
+            while best < len(ranking) and ranking[best][0].harvested:
+                best += 1
+            best_field, best_harvest = ranking[best] if best < len(ranking) else (None, 0)
+
+            farm_chance = self.settlement.model.streams['farm'].uniform(0, 1)
+            if best_field is not None and (self.grain < (
+                    self.workers * ANNUAL_PER_PERSON_GRAIN_CONSUMPTION) or farm_chance < self.ambition * self.competency):
+                best_field.harvest()
+                total_harvest += best_harvest - SEEDING_COST
+                self.workers_worked += 2
+
+        self.grain += total_harvest
+
     def storage_loss(self):
         """ Accounts for typical annual storage loss of agricultural product """
         self.grain -= self.grain * 0.1
@@ -151,11 +220,13 @@ class Household():
                 # a household will die off if it has no workers left
                 self.settlement.households.remove(self)
                 self.settlement.model.households.remove(self)
+                self.settlement.model.rental_schedule.remove(self)
                 self.release_field_claim()
 
-    def population_shift(self):
+    def population_shift(self, populate_chance=None):
         """ Increase population stochastically in proportion to the population growth rate """
-        populate_chance = self.settlement.random.uniform(0, 1)
+        if populate_chance is None:
+            populate_chance = self.settlement.model.streams['population'].uniform(0, 1)
         # criteria for increasing population as per netLogo implementation
         if (compute_total_population(self.settlement.model) <= \
                 (self.settlement.model.starting_population * (1 + self.settlement.model.population_growth_rate/100) ** self.settlement.model.ticks)) \
@@ -172,46 +243,56 @@ class Household():
     def generation_changeover(self):
         """ Change competency and ambition values every 10-15 years to simulate a new head of household """
         # Note: this routine is as per the netlogo implementation but is wildly inefficient.
+        rng = self.settlement.model.streams['generation']
         self.generation_changeover_countdown -= 1
         if self.generation_changeover_countdown <= 0:
             # reset generation changeover countdown
-            self.generation_changeover_countdown = self.settlement.random.randint(10, 14)
+            self.generation_changeover_countdown = rng.randint(10, 14)
 
-            ambition_change = self.settlement.random.uniform(0, self.settlement.model.generational_variation)
-            decrease_chance = self.settlement.random.uniform(0, 1)
+            ambition_change = rng.uniform(0, self.settlement.model.generational_variation)
+            decrease_chance = rng.uniform(0, 1)
             if decrease_chance < 0.5:
                 ambition_change *= -1
             new_ambition = self.ambition + ambition_change
             while new_ambition > 1 or new_ambition < self.settlement.model.min_ambition:
-                ambition_change = self.settlement.random.uniform(0, self.settlement.model.generational_variation)
-                decrease_chance = self.settlement.random.uniform(0, 1)
+                ambition_change = rng.uniform(0, self.settlement.model.generational_variation)
+                decrease_chance = rng.uniform(0, 1)
                 if decrease_chance < 0.5:
                     ambition_change *= -1
                 new_ambition = self.ambition + ambition_change
             self.ambition = new_ambition
 
-            competency_change = self.settlement.random.uniform(0, self.settlement.model.generational_variation)
-            decrease_chance = self.settlement.random.uniform(0, 1)
+            competency_change = rng.uniform(0, self.settlement.model.generational_variation)
+            decrease_chance = rng.uniform(0, 1)
             if decrease_chance < 0.5:
                 competency_change *= -1
             new_competency = self.competency + competency_change
             while new_competency > 1 or new_competency < self.settlement.model.min_competency:
-                competency_change = self.settlement.random.uniform(0, self.settlement.model.generational_variation)
-                decrease_chance = self.settlement.random.uniform(0, 1)
+                competency_change = rng.uniform(0, self.settlement.model.generational_variation)
+                decrease_chance = rng.uniform(0, 1)
                 if decrease_chance < 0.5:
                     competency_change *= -1
                 new_competency = self.competency + competency_change
             self.competency = new_competency
 
-    def claim_fields(self):
+    def claim_fields(self, claim_chance=None):
         """Allows households to decide (function of the field productivity compared to existing fields and ambition) to claim/ not claim fields that fall within their knowledge radii"""
-        claim_chance = self.settlement.random.uniform(0, 1)  # set random value between 0 and 1
+        if claim_chance is None:
+            claim_chance = self.settlement.model.streams['claim'].uniform(0, 1)  # set random value between 0 and 1
         if (claim_chance < self.ambition) and (self.workers > len(self.fields)) or (len(self.fields) <= 1):
             best_X_fertility = 0
             best_Y_fertility = 0
             best_fertility = -1
 
             household_x, household_y = self.settlement.pos
+            kernels = self.settlement.model.kernels
+            if kernels is not None:
+                best = kernels.best_claim(self.settlement.model.grid.fertility, self.settlement.model.grid.occupancy,
+                                          household_x, household_y, self.settlement.model.knowledge_radius)
+                if best is not None:
+                    self.complete_claim(*best)
+                return
+
             xmin = household_x - self.settlement.model.knowledge_radius
             ymin = household_y - self.settlement.model.knowledge_radius
             xmax = household_x + self.settlement.model.knowledge_radius
@@ -240,7 +321,7 @@ class Household():
 
     def complete_claim(self, x, y):
         """Once household determines whether or not to claim ownership, this methods sets new ownership"""
-        field = FieldAgent(self.settlement.random.random(), self.settlement.model, self)
+        field = FieldAgent(self.settlement.model.streams['claim'].random(), self.settlement.model, self)
         self.settlement.model.grid.position_agent(field, x, y)
         self.fields.append(field)
         self.settlement.model.fields.append(field)
@@ -250,9 +331,14 @@ class Household():
         for field in self.fields:
             self.settlement.model.grid.remove_agent(field)
             self.settlement.model.fields.remove(field)
+            field.expiry = None  # skip the field in the fallow schedule
 
     def rent_land(self):
         """if global variable 'rent land' is on, ambitious households ae allowed to farm additional plots they don't own, after everyone has finished main farming/harvesting """
+        if self.settlement.model.kernels is not None:
+            self.rent_land_ranked()
+            return
+
         total_harvest = 0
         for i in range((self.workers - self.workers_worked) // 2):
             best_harvest = 0
@@ -283,29 +369,82 @@ class Household():
                                 best_harvest = this_harvest
                                 best_field = field_cell
 
-            harvest_chance = self.settlement.random.uniform(0, 1)
+            harvest_chance = self.settlement.model.streams['rent'].uniform(0, 1)
             if best_field is not None and best_field not in self.fields and harvest_chance < (self.competency * self.ambition):
-                best_field.harvested = True
+                best_field.harvest()
                 total_harvest += ((best_harvest * (1 - self.settlement.model.land_rental_rate)) - SEEDING_COST)  # renter bears seeding cost
 
                 best_field.household.grain += best_harvest * self.settlement.model.land_rental_rate  # seller makes a profit
 
         self.grain += total_harvest
 
+    def rent_land_ranked(self):
+        """ Same as rent_land, but scores the fields in the knowledge radius once with the model's kernels and ranks them instead of rescanning them for every worker pair """
+        model = self.settlement.model
+        household_x, household_y = self.settlement.pos
+        field_xs, field_ys, harvests = model.kernels.rental_harvests(model.grid.fertility, model.grid.occupancy, household_x, household_y,
+                                                                     model.knowledge_radius, self.competency, model.distance_cost,
+                                                                     PATCH_MAX_POTENTIAL_YIELD)
+        # the scan keeps the last of equally good fields, and fields with a harvest of zero as well
+        order = len(harvests) - 1 - np.argsort(-harvests[::-1], kind='stable')
+        ranking = [(model.grid.grid[field_xs[i]][field_ys[i]], harvests[i]) for i in order if harvests[i] >= 0]
+
+        total_harvest = 0
+        best = 0
+        for i in range((self.workers - self.workers_worked) // 2):
+            while best < len(ranking) and ranking[best][0].harvested:
+                best += 1
+            best_field, best_harvest = ranking[best] if best < len(ranking) else (None, 0)
+
+            harvest_chance = self.settlement.model.streams['rent'].uniform(0, 1)
+            if best_field is not None and best_field not in self.fields and harvest_chance < (self.competency * self.ambition):
+                best_field.harvest()
+                total_harvest += ((best_harvest * (1 - model.land_rental_rate)) - SEEDING_COST)  # renter bears seeding cost
+
+                best_field.household.grain += best_harvest * model.land_rental_rate  # seller makes a profit
+
+        self.grain += total_harvest
+
 
 class EgyptGrid(SingleGrid):
     """A MESA grid containing the fertility values for patches of land."""
 
-    def __init__(self, width, height, model):
+    def __init__(self, width, height, model, raster=None):
         super().__init__(width, height, torus=False)
         self.width = width
         self.height = height
-        self.random = model.random
+        self.model = model
+        self.random = model.streams['flood']
+        # fertility rasters to flood from instead of the normal distribution, see egypt_raster.FertilityRaster
+        self.raster = raster
+        if raster is not None:
+            raster.check_shape(width, height)
         self.fertility = np.zeros((height, width))
+        self.occupancy = np.full((height, width), EMPTY, dtype=np.int8)  # what occupies each patch, for the household kernels
+        self.version = 0  # incremented whenever fertility or occupancy change
+        self.release_version = 0  # incremented whenever fertility changes or a patch is vacated
         self.flood()  # initialise fertility values
 
+    def _place_agent(self, pos, agent):
+        super()._place_agent(pos, agent)
+        x, y = pos
+        self.occupancy[y, x] = FIELD if isinstance(agent, FieldAgent) else SETTLEMENT
+        self.version += 1
+
+    def _remove_agent(self, pos, agent):
+        super()._remove_agent(pos, agent)
+        x, y = pos
+        self.occupancy[y, x] = EMPTY
+        self.version += 1
+        self.release_version += 1
+
     def flood(self):
         """Simulates nile flood. Assigns new patch fertility values."""
+        if self.raster is not None:
+            self.raster.flood(self)
+            self.version += 1
+            self.release_version += 1
+            return
         # Set fertility values according to normal distribution probability density function
         # see https://en.wikipedia.org/wiki/Normal_distribution
         # the mean and standard deviation value ranges are according to NetLogo source code
@@ -317,6 +456,107 @@ class EgyptGrid(SingleGrid):
         for x in range(self.width):
             # assign fertility value to column x
             self.fertility[:, x] = 17 * (beta * (e ** (-(x - mu) ** 2 / alpha)))
+        self.version += 1
+        self.release_version += 1
+
+
+# the stochastic processes of the model: settlement and household initialisation, the flood and the household decisions
+STREAMS = ['init', 'flood', 'farm', 'claim', 'rent', 'population', 'generation']
+
+
+class BatchedRandom():
+    """Hands out uniforms drawn from a NumPy generator a batch at a time, with the random.Random methods the model uses.
+
+    The batch is kept both as an array, which uniforms(n) slices for vectorised phases, and as a list, which the scalar
+    methods index without creating a NumPy scalar for every draw. Either way uniforms come out in the order they were drawn.
+    """
+
+    def __init__(self, generator, batch_size=4096):
+        self.generator = generator
+        self.batch_size = batch_size
+        self.batch = np.empty(0)
+        self.values = []
+        self.cursor = 0  # index of the next uniform in the batch
+
+    def refill(self):
+        """ Draws the next batch once the current one has been handed out """
+        self.batch = self.generator.random(self.batch_size)
+        self.values = self.batch.tolist()
+        self.cursor = 0
+
+    def random(self):
+        """ Returns the next uniform in [0, 1) """
+        if self.cursor == len(self.values):
+            self.refill()
+        value = self.values[self.cursor]
+        self.cursor += 1
+        return value
+
+    def uniform(self, a, b):
+        if self.cursor == len(self.values):
+            self.refill()
+        value = self.values[self.cursor]
+        self.cursor += 1
+        return a + (b - a) * value
+
+    def randint(self, a, b):
+        return a + int(self.random() * (b - a + 1))
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+    def uniforms(self, n):
+        """ Returns the next n uniforms as an array, e.g. for a vectorised phase """
+        available = len(self.values) - self.cursor
+        if n <= available:
+            values = self.batch[self.cursor:self.cursor + n]
+            self.cursor += n
+            return values
+        rest = self.batch[self.cursor:]
+        if n - available >= self.batch_size // 8:
+            # a large request draws straight from the generator, the draws are not needed as a list
+            self.cursor = len(self.values)
+            return np.concatenate((rest, self.generator.random(n - available)))
+        self.refill()
+        self.cursor = n - available
+        return np.concatenate((rest, self.batch[:self.cursor]))
+
+
+def random_generator(seed, rng='python'):
+    """ Returns a random.Random, or for rng='numpy' a BatchedRandom, seeded with seed """
+    if rng == 'python':
+        return random.Random(seed)
+    elif rng == 'numpy':
+        return BatchedRandom(np.random.default_rng(seed))
+    raise ValueError("unknown random number generator '{}', expected 'python' or 'numpy'".format(rng))
+
+
+def random_streams(seed, rng='python'):
+    """
+    Returns an independent random number generator for each stochastic process, all derived from seed. Changing how
+    often one process draws, e.g. by changing a parameter, then leaves the draws of the other processes unchanged.
+    """
+    sequences = np.random.SeedSequence(seed).spawn(len(STREAMS))
+    return {name: random_generator(int.from_bytes(sequence.generate_state(4).tobytes(), 'little'), rng)
+            for name, sequence in zip(STREAMS, sequences)}
+
+
+class ModelReporters():
+    """Collects model reporters each tick like mesa's DataCollector, which imports pandas up front even if no data frame is needed."""
+
+    agent_reporters = None  # checked by mesa's BatchRunner
+
+    def __init__(self, model_reporters):
+        self.model_reporters = model_reporters
+        self.model_vars = {name: [] for name in model_reporters}
+
+    def collect(self, model):
+        for name, reporter in self.model_reporters.items():
+            self.model_vars[name].append(reporter(model))
+
+    def get_model_vars_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame(self.model_vars)
 
 
 class EgyptModel(Model):
@@ -336,7 +576,14 @@ class EgyptModel(Model):
                  distance_cost=10,
                  land_rental_rate=0.5,
                  allow_rental=True,
-                 annual_competency_increase=0):
+                 annual_competency_increase=0,
+                 kernels='python',
+                 strips=None,
+                 seed=None,
+                 streams=False,
+                 rng='python',
+                 fertility=None,
+                 fertility_per_tick=False):
         self.land_rental_rate = land_rental_rate
         self.allow_rental = allow_rental
         self.starting_settlements = starting_settlements
@@ -352,12 +599,25 @@ class EgyptModel(Model):
         self.fallow_limit = fallow_limit
         self.distance_cost = distance_cost
         self.annual_competency_increase = annual_competency_increase
+        # 'python' runs the reference loops in Household, 'numpy', 'jit' or 'strips' the equivalent kernels in egypt_kernels
+        self.kernels = get_kernels(kernels, strips)
         self.ticks = 0
+        # the generator each stochastic process draws from, either one generator shared by all or an independent stream each
+        # 'python' draws from random.Random, 'numpy' hands out uniforms drawn in bulk from a NumPy generator
+        self.streams = random_streams(seed, rng) if streams else dict.fromkeys(STREAMS, random_generator(seed, rng))
+        # mesa keeps the random number generator on the class, give each model its own so that models can run side by side
+        self.random = self.streams['init']
 
         # Create scheduler
         self.schedule = RandomActivation(self)
+        # households rent land in order of ambition, most ambitious first. Ambition only changes at generation changeover,
+        # so the order is kept incrementally. Grain changes every tick, so the claim order is simply re-sorted.
+        self.rental_schedule = OrderedActivation('ambition')
+        # fields are released once they lie fallow for fallow_limit ticks
+        self.fallow_schedule = FallowSchedule(self)
         # Create grid
-        self.grid = EgyptGrid(w, h, self)
+        # fertility is either drawn from a normal distribution at each flood or, given the path of a raster file, read from it
+        self.grid = EgyptGrid(w, h, self, None if fertility is None else FertilityRaster(fertility, fertility_per_tick))
         self.running = True  # BatchRunner set true
 
         self.settlements = []
@@ -377,26 +637,36 @@ class EgyptModel(Model):
             )
             self.settlements.append(agent)
             self.grid.position_agent(agent)  # place agent in a random empty patch
-            # data collection
-            self.datacollector = DataCollector(
-                model_reporters={'Gini': compute_gini,
-                                 'Total Population': compute_total_population,
-                                 'Mean Settlement Population': compute_mean_population,
-                                 "Total Wealth": compute_total_wealth,
-                                 "Mean Settlement Wealth": compute_mean_wealth})
+
+        # data collection
+        self.datacollector = ModelReporters(
+            {'Gini': compute_gini,
+             'Total Population': compute_total_population,
+             'Mean Settlement Population': compute_mean_population,
+             "Total Wealth": compute_total_wealth,
+             "Mean Settlement Wealth": compute_mean_wealth})
+
+        # a model without any households can never change state
+        if self.is_absorbed():
+            self.running = False
 
     def step(self):
         """Advance the model by one tick."""
         self.grid.flood()
 
-        for household in sorted(self.households, key=lambda household: household.grain, reverse=True):
-            household.claim_fields()
+        if self.kernels is not None:
+            self.kernels.prepare(self, 'claim')
+        claimants = sorted(self.households, key=lambda household: household.grain, reverse=True)
+        for household, chance in zip(claimants, self.chances('claim', len(claimants))):
+            household.claim_fields(chance)
 
         for household in self.households:
             household.farm()
 
         if self.allow_rental:
-            for household in sorted(self.households, key=lambda household: household.ambition, reverse=True):
+            if self.kernels is not None:
+                self.kernels.prepare(self, 'rent')
+            for household in self.rental_schedule.agents():
                 household.rent_land()
 
         for household in self.households:
@@ -405,8 +675,7 @@ class EgyptModel(Model):
         for household in self.households:
             household.storage_loss()
 
-        for field in self.fields:
-            field.changeover()
+        self.fallow_schedule.changeover()
 
         for household in self.households:
             household.storage_loss()
@@ -417,8 +686,27 @@ class EgyptModel(Model):
         for household in self.households:
             household.competency_increase()
 
-        for household in self.households:
-            household.population_shift()
+        for household, chance in zip(self.households, self.chances('population', len(self.households))):
+            household.population_shift(chance)
 
         self.ticks += 1
+        self.schedule.steps += 1  # keeps mesa's BatchRunner max_steps check in sync with ticks
         self.datacollector.collect(self)
+
+        if self.is_absorbed():
+            self.running = False
+
+    def chances(self, stream, n):
+        """
+        Returns the chances of n households for one phase. Streams that draw in bulk (rng='numpy', or a wrapper of one)
+        draw them in one go, otherwise they are None and each household draws its own, in the same order.
+        """
+        generator = self.streams[stream]
+        if hasattr(generator, 'uniforms'):
+            return generator.uniforms(n).tolist()
+        return [None] * n
+
+    def is_absorbed(self):
+        """Returns True once no further step can change the model, i.e. every household has died off.
+        Zero population alone is not absorbing: households with grain left can still regrow via population_shift."""
+        return len(self.households) == 0
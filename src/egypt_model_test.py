@@ -1,3 +1,7 @@
+import os
+import subprocess
+import sys
+import numpy as np
 import egypt_model
 import unittest
 
@@ -174,5 +178,101 @@ class TestFieldMethods(unittest.TestCase):
         self.assertTrue(self.field not in self.household.fields)
         self.assertTrue(self.field not in self.model.fields)
 
+class TestModelMethods(unittest.TestCase):
+
+    def test_running_without_households(self):
+        model = egypt_model.EgyptModel(31, 30, starting_settlements=9, starting_households=0, starting_household_size=5, starting_grain=1000)
+        self.assertFalse(model.running)
+
+        model = egypt_model.EgyptModel(31, 30, starting_settlements=0, starting_households=5, starting_household_size=5, starting_grain=1000)
+        self.assertFalse(model.running)
+
+    def test_early_termination(self):
+        # households without grain that can never profit from a field die off within a few ticks
+        model = egypt_model.EgyptModel(31, 30, starting_settlements=3, starting_households=4, starting_household_size=1, starting_grain=0, distance_cost=10 ** 9)
+        self.assertTrue(model.running)
+
+        while model.running and model.ticks < 1000:
+            model.step()
+        self.assertFalse(model.running)
+        self.assertLess(model.ticks, 1000)
+        self.assertEqual(model.schedule.steps, model.ticks)
+        self.assertEqual(len(model.households), 0)
+
+        final_values = model.datacollector.get_model_vars_dataframe().iloc[-1]
+        self.assertEqual(final_values['Total Population'], 0)
+        self.assertEqual(final_values['Total Wealth'], 0)
+        self.assertEqual(final_values['Gini'], 0)
+
+    def test_random_streams(self):
+        def floods(**parameters):
+            model = egypt_model.EgyptModel(31, 30, seed=3, **parameters)
+            fertility = []
+            for i in range(10):
+                model.step()
+                fertility.append(model.grid.fertility[0].copy())
+            return fertility
+
+        # a seed reproduces the run
+        self.assertTrue(all((a == b).all() for a, b in zip(floods(streams=True), floods(streams=True))))
+        # with independent streams the floods do not depend on how often the households draw
+        self.assertTrue(all((a == b).all() for a, b in zip(floods(streams=True, allow_rental=True), floods(streams=True, allow_rental=False))))
+        self.assertFalse(all((a == b).all() for a, b in zip(floods(allow_rental=True), floods(allow_rental=False))))
+
+    def test_batched_random(self):
+        def run(**parameters):
+            model = egypt_model.EgyptModel(31, 30, seed=4, rng='numpy', **parameters)
+            for i in range(10):
+                model.step()
+            return egypt_model.compute_total_wealth(model), egypt_model.compute_gini(model)
+
+        self.assertEqual(run(), run())
+        self.assertEqual(run(streams=True), run(streams=True))
+        self.assertEqual(run(kernels='numpy'), run())
+
+        # uniforms are handed out in the order they were drawn, whether one at a time or in bulk
+        draws = egypt_model.BatchedRandom(np.random.default_rng(1), batch_size=7).uniforms(20)
+        generator = egypt_model.BatchedRandom(np.random.default_rng(1), batch_size=3)
+        self.assertEqual(generator.random(), draws[0])
+        self.assertTrue((generator.uniforms(18) == draws[1:19]).all())
+        self.assertEqual(generator.uniform(2, 4), 2 + 2 * draws[19])
+        self.assertTrue((np.random.default_rng(1).random(20) == draws).all())
+        generator = egypt_model.BatchedRandom(np.random.default_rng(1), batch_size=16)
+        self.assertTrue((np.concatenate([generator.uniforms(5), [generator.random()], generator.uniforms(30), generator.uniforms(12)])
+                         == np.random.default_rng(1).random(48)).all())
+
+        # with rng='numpy' the claim and population chances of each tick are drawn in one go
+        model = egypt_model.EgyptModel(31, 30, seed=1, rng='numpy')
+        self.assertEqual(len(model.chances('claim', 5)), 5)
+        self.assertEqual(egypt_model.EgyptModel(31, 30, seed=1).chances('claim', 2), [None, None])
+
+        # a stream wrapped in something that passes uniforms through still draws in bulk, and so makes the same run
+        class Wrapper():
+            def __init__(self, generator):
+                self.generator = generator
+
+            def __getattr__(self, name):
+                return getattr(self.generator, name)
+
+        def wealth(wrap):
+            model = egypt_model.EgyptModel(31, 30, seed=1, rng='numpy')
+            if wrap:
+                model.streams.update({name: Wrapper(stream) for name, stream in model.streams.items()})
+            for i in range(10):
+                model.step()
+            return egypt_model.compute_total_wealth(model)
+
+        self.assertEqual(wealth(True), wealth(False))
+
+        with self.assertRaises(ValueError):
+            egypt_model.EgyptModel(31, 30, rng='mersenne')
+
+    def test_lazy_imports(self):
+        # pandas and numba are slow to import and not needed to run the model
+        code = "import sys, egypt_model; egypt_model.EgyptModel(31, 30).step(); print('pandas' in sys.modules, 'numba' in sys.modules)"
+        output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.split(), ['False', 'False'])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,80 @@
+import sys
+import numpy as np
+from math import sqrt, pi, e
+
+
+class FertilityRaster():
+    """Fertility rasters read lazily from a memory-mapped .npy file indexed [regime, y, x] (or [y, x] for a single raster).
+
+    Each flood either draws one of the flood regimes at random or, with per_tick, takes the raster of the current tick
+    (cycling through the file), and copies the tiles of it that lie within the knowledge radius of settlements that still
+    have households into the grid's fertility. Nothing else in the model reads fertility, so the rest of the file is never
+    paged in, and worker processes share the pages they do read through the page cache. The grid itself still takes
+    memory for every cell.
+    """
+
+    def __init__(self, path, per_tick=False, tile_size=64):
+        self.rasters = np.load(path, mmap_mode='r')
+        if self.rasters.ndim == 2:
+            self.rasters = self.rasters[np.newaxis]
+        self.per_tick = per_tick
+        self.tile_size = tile_size
+        self.tiles = set()  # (row, column) of the tiles copied into the grid, refreshed at every flood
+        self.current = None  # the raster of the last flood
+
+    def check_shape(self, width, height):
+        if self.rasters.shape[1:] != (height, width):
+            raise ValueError('fertility rasters are {}x{} but the grid is {}x{}'.format(
+                self.rasters.shape[2], self.rasters.shape[1], width, height))
+
+    def regime(self, grid):
+        if self.per_tick:
+            return grid.model.ticks % len(self.rasters)
+        return grid.random.randint(0, len(self.rasters) - 1)
+
+    def tiles_near(self, positions, radius, width, height):
+        """ Returns the tiles that overlap the knowledge radius of any of the positions """
+        t = self.tile_size
+        tiles = set()
+        for x, y in positions:
+            for row in range(max(y - radius, 0) // t, min(y + radius, height - 1) // t + 1):
+                for column in range(max(x - radius, 0) // t, min(x + radius, width - 1) // t + 1):
+                    tiles.add((row, column))
+        return tiles
+
+    def flood(self, grid):
+        """ Copies the tiles of the next raster near active settlements into the grid's fertility """
+        self.current = self.regime(grid)
+        raster = self.rasters[self.current]
+        settlements = getattr(grid.model, 'settlements', [])  # there are none yet at the first flood
+        positions = [settlement.pos for settlement in settlements if settlement.households]
+        # settlements never move, so tiles are only ever added
+        self.tiles |= self.tiles_near(positions, grid.model.knowledge_radius, grid.width, grid.height)
+
+        t = self.tile_size
+        for row, column in self.tiles:
+            window = (slice(row * t, (row + 1) * t), slice(column * t, (column + 1) * t))
+            grid.fertility[window] = raster[window]
+
+
+def write_gaussian_regimes(path, width, height, dtype=np.float32):
+    """
+    Writes the fertility of every flood EgyptGrid.flood can generate, one regime for each mean 5-14 and standard deviation
+    5-9, as a raster file. The file is written a regime at a time, so it can be far larger than memory.
+    """
+    regimes = [(mu, sigma) for mu in range(5, 15) for sigma in range(5, 10)]
+    rasters = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(len(regimes), height, width))
+    x = np.arange(width)
+    for i, (mu, sigma) in enumerate(regimes):
+        alpha = 2 * sigma ** 2
+        beta = 1 / (sigma * sqrt(2 * pi))
+        rasters[i] = 17 * (beta * (e ** (-(x - mu) ** 2 / alpha)))
+    rasters.flush()
+    return regimes
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4:
+        print("Usage:\tpython3 src/egypt_raster.py [output.npy] [grid_width] [grid_height]")
+        quit()
+    write_gaussian_regimes(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
@@ -0,0 +1,69 @@
+import egypt_model
+import egypt_raster
+import numpy as np
+import os
+import tempfile
+import unittest
+
+
+class TestFertilityRaster(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_gaussian_regimes(self):
+        # a flood from the regime file has the fertility of the analytic flood with the same mean and standard deviation
+        path = self.path('regimes.npy')
+        regimes = egypt_raster.write_gaussian_regimes(path, 31, 30, dtype=np.float64)
+        model = egypt_model.EgyptModel(31, 30, seed=1, knowledge_radius=40, fertility=path)
+        reference = egypt_model.EgyptModel(31, 30, seed=1)
+        for i in range(5):
+            model.step()
+            mu, sigma = regimes[model.grid.raster.current]
+            reference.grid.random = FixedRandom([mu, sigma])
+            reference.grid.flood()
+            np.testing.assert_allclose(model.grid.fertility, reference.grid.fertility)
+
+    def test_tiles_near_settlements(self):
+        # only the tiles within the knowledge radius of settlements are read
+        path = self.path('large.npy')
+        np.save(path, np.ones((2, 256, 256)))
+        model = egypt_model.EgyptModel(256, 256, seed=2, starting_settlements=2, knowledge_radius=5, fertility=path)
+        model.step()
+        x, y = model.settlements[0].pos
+        self.assertEqual(model.grid.fertility[y, x], 1)
+        self.assertLessEqual(len(model.grid.raster.tiles), 8)
+        self.assertEqual(np.count_nonzero(model.grid.fertility), len(model.grid.raster.tiles) * 64 ** 2)
+
+    def test_per_tick(self):
+        path = self.path('ticks.npy')
+        np.save(path, np.arange(1, 4).reshape(3, 1, 1) * np.ones((3, 30, 31)))
+        model = egypt_model.EgyptModel(31, 30, seed=3, fertility=path, fertility_per_tick=True)
+        x, y = model.settlements[0].pos
+        for expected in [1, 2, 3, 1]:
+            model.step()
+            self.assertEqual(model.grid.fertility[y, x], expected)
+
+    def test_shape(self):
+        path = self.path('small.npy')
+        np.save(path, np.ones((20, 20)))
+        with self.assertRaises(ValueError):
+            egypt_model.EgyptModel(31, 30, fertility=path)
+
+
+class FixedRandom():
+    def __init__(self, values):
+        self.values = iter(values)
+
+    def randint(self, a, b):
+        return next(self.values)
+
+
+if __name__ == '__main__':
+    unittest.main()
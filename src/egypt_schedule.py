@@ -0,0 +1,103 @@
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+
+class OrderedActivation():
+    """Keeps agents ordered by an attribute, highest first, without re-sorting every tick.
+
+    Agents with equal values keep the order in which they were added, which matches
+    sorted(agents, key=..., reverse=True) over a list that agents are only ever appended to or removed from.
+    Agents call update() whenever the attribute changes; the order is patched lazily on the next call to agents().
+    """
+
+    def __init__(self, attribute):
+        self.attribute = attribute
+        self._order = []  # sorted list of (-value, sequence number, agent) entries
+        self._entries = {}
+        self._dirty = set()
+        self._next_sequence = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _entry(self, agent, sequence):
+        return -getattr(agent, self.attribute), sequence, agent
+
+    def add(self, agent):
+        """ Adds an agent after all existing agents with the same value """
+        entry = self._entry(agent, self._next_sequence)
+        self._next_sequence += 1
+        self._entries[agent] = entry
+        insort(self._order, entry)
+
+    def remove(self, agent):
+        """ Removes an agent, e.g. when a household dies off """
+        entry = self._entries.pop(agent)
+        del self._order[bisect_left(self._order, entry)]
+        self._dirty.discard(agent)
+
+    def update(self, agent):
+        """ Marks an agent whose attribute has changed. Unknown agents are ignored. """
+        if agent in self._entries:
+            self._dirty.add(agent)
+
+    def agents(self):
+        """ Returns a list of the agents, highest value first """
+        if self._dirty:
+            if len(self._dirty) * 8 < len(self._order):
+                # only a few agents changed, move each one to its new position
+                for agent in self._dirty:
+                    entry = self._entries[agent]
+                    del self._order[bisect_left(self._order, entry)]
+                    entry = self._entry(agent, entry[1])
+                    self._entries[agent] = entry
+                    insort(self._order, entry)
+            else:
+                # most agents changed, re-sort starting from the previous order which is usually nearly sorted already
+                for agent in self._dirty:
+                    self._entries[agent] = self._entry(agent, self._entries[agent][1])
+                self._order = [self._entries[entry[2]] for entry in self._order]
+                self._order.sort()
+            self._dirty.clear()
+
+        return [entry[2] for entry in self._order]
+
+
+class FallowSchedule():
+    """A bucket queue of fields keyed by the tick at which they will have lain fallow for too long.
+
+    A field is rescheduled whenever it is harvested, so each tick only touches the fields harvested
+    that tick and the fields expiring that tick instead of every field. Fields that are released by other
+    means (e.g. when their household dies off) have their expiry cleared and are skipped when their bucket comes up.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._buckets = defaultdict(list)
+        self._harvested = []
+
+    def _schedule(self, field, last_harvest):
+        # a field is released at the changeover in which years_fallowed reaches the fallow limit,
+        # which is never earlier than the current tick's changeover
+        field.expiry = max(last_harvest + self.model.fallow_limit, self.model.ticks)
+        self._buckets[field.expiry].append(field)
+
+    def add(self, field):
+        """ Schedules a newly claimed field, which has not been harvested yet """
+        self._schedule(field, self.model.ticks - 1)
+
+    def harvest(self, field):
+        """ Reschedules a field harvested this tick """
+        self._harvested.append(field)
+        self._schedule(field, self.model.ticks)
+
+    def changeover(self):
+        """ Releases the fields whose fallow limit is reached this tick and resets this tick's harvests """
+        tick = self.model.ticks
+        for field in self._buckets.pop(tick, []):
+            if field.expiry == tick:
+                field.release()
+
+        for field in self._harvested:
+            field.harvested = False
+        self._harvested = []
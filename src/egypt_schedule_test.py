@@ -0,0 +1,128 @@
+import egypt_model
+import egypt_schedule
+import unittest
+
+
+class Agent():
+
+    def __init__(self, value):
+        self.value = value
+
+
+class TestOrderedActivation(unittest.TestCase):
+
+    def setUp(self):
+        self.agents = [Agent(value) for value in [3, 1, 2, 1, 3, 0, 2]]
+        self.schedule = egypt_schedule.OrderedActivation('value')
+        for agent in self.agents:
+            self.schedule.add(agent)
+
+    def assertSortedOrder(self):
+        self.assertEqual(self.schedule.agents(), sorted(self.agents, key=lambda agent: agent.value, reverse=True))
+
+    def test_ties(self):
+        self.assertSortedOrder()
+        self.assertEqual(len(self.schedule), len(self.agents))
+
+    def test_update(self):
+        # a few changes are patched in place
+        self.agents[1].value = 3
+        self.schedule.update(self.agents[1])
+        self.assertSortedOrder()
+
+        # many changes are re-sorted
+        for i, agent in enumerate(self.agents):
+            agent.value = i % 3
+            self.schedule.update(agent)
+        self.assertSortedOrder()
+
+    def test_remove(self):
+        self.agents[2].value = 5
+        self.schedule.update(self.agents[2])
+        self.schedule.remove(self.agents[2])
+        self.agents.remove(self.agents[2])
+        self.assertSortedOrder()
+
+        self.schedule.update(Agent(4))  # unknown agents are ignored
+        self.assertSortedOrder()
+
+    def test_model_order(self):
+        model = egypt_model.EgyptModel(31, 30, starting_settlements=9, starting_households=5, starting_household_size=5, starting_grain=1000)
+        for i in range(30):
+            self.assertEqual(model.rental_schedule.agents(), sorted(model.households, key=lambda household: household.ambition, reverse=True))
+            model.step()
+
+
+class TestFallowSchedule(unittest.TestCase):
+
+    def setUp(self):
+        # seeded so that no settlement lands on the cells the tests claim
+        self.model = egypt_model.EgyptModel(31, 30, starting_settlements=9, starting_households=5, starting_household_size=5, starting_grain=1000,
+                                            seed=1)
+        self.model.fallow_limit = 4
+        self.household = self.model.households[0]
+
+    def claim(self, x, y):
+        self.household.complete_claim(x, y)
+        return self.household.fields[-1]
+
+    def changeover(self, ticks):
+        for i in range(ticks):
+            self.model.fallow_schedule.changeover()
+            self.model.ticks += 1
+
+    def test_expiry(self):
+        field = self.claim(0, 0)
+        self.changeover(3)
+        self.assertTrue(field in self.model.fields)
+        self.changeover(1)
+        self.assertTrue(field not in self.model.fields)
+        self.assertTrue(field not in self.household.fields)
+        self.assertTrue(self.model.grid.is_cell_empty((0, 0)))
+
+    def test_harvest(self):
+        field = self.claim(0, 0)
+        self.changeover(2)
+        field.harvest()
+        self.changeover(1)
+        self.assertFalse(field.harvested)
+        self.changeover(3)
+        self.assertTrue(field in self.model.fields)
+        self.changeover(1)
+        self.assertTrue(field not in self.model.fields)
+
+    def test_zero_fallow_limit(self):
+        self.model.fallow_limit = 0
+        field = self.claim(0, 0)
+        field.harvest()
+        self.changeover(1)
+        self.assertTrue(field not in self.model.fields)
+
+    def test_released_fields(self):
+        field = self.claim(0, 0)
+        self.household.release_field_claim()
+        self.assertIsNone(field.expiry)
+        self.changeover(5)
+        self.assertTrue(self.model.grid.is_cell_empty((0, 0)))
+
+    def test_matches_changeover(self):
+        # the schedule releases a field at the same tick as calling changeover() on it every tick would
+        for fallow_limit in range(6):
+            for harvest_ticks in [[], [0], [1, 2], [0, 3, 4], [2, 6]]:
+                self.model.fallow_limit = fallow_limit
+                field = self.claim(0, 0)
+                reference = self.claim(0, 1)
+                self.model.fallow_schedule._buckets[reference.expiry].remove(reference)
+
+                for tick in range(12):
+                    if tick in harvest_ticks and field in self.model.fields:
+                        field.harvest()
+                        reference.harvested = True
+                    if reference in self.model.fields:
+                        reference.changeover()
+                    self.changeover(1)
+                    self.assertEqual(field in self.model.fields, reference in self.model.fields)
+
+
+if __name__ == '__main__':
+    unittest.main()
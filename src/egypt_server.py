@@ -0,0 +1,249 @@
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import tornado.escape
+import tornado.ioloop
+import tornado.locks
+import tornado.websocket
+from mesa.visualization.ModularVisualization import ModularServer, SocketHandler
+from mesa.visualization.UserParam import UserSettableParameter
+
+
+def render(model, elements):
+    return [element.render(model) for element in elements]
+
+
+def session_worker(connection, model_cls, elements):
+    """
+    Runs in a worker process that owns the models of some of the sessions. It creates, steps and renders them on request
+    and answers every request with ('ok', result) or ('error', message).
+    """
+    models = {}
+
+    while True:
+        message = connection.recv()
+        kind = message[0]
+
+        if kind == 'stop':
+            return
+
+        try:
+            if kind == 'reset':
+                _, session, params = message
+                models[session] = model_cls(**params)
+                connection.send(('ok', render(models[session], elements)))
+
+            elif kind == 'step':
+                _, session, params = message
+                if session not in models:
+                    models[session] = model_cls(**params)
+                model = models[session]
+                if model.running:
+                    model.step()
+                    connection.send(('ok', render(model, elements)))
+                else:
+                    connection.send(('ok', None))  # the model has ended
+
+            elif kind == 'close':
+                _, session = message
+                models.pop(session, None)
+                connection.send(('ok', None))
+
+        except Exception as error:
+            connection.send(('error', repr(error)))
+
+
+class SimulationWorker():
+    """A worker process and the thread that waits on it, so that the event loop never blocks on a model.
+
+    A worker process that has died is started again. The models of its sessions are lost: a request that was waiting on it
+    fails, and the next step of each of its sessions starts a new model with the session's parameters.
+    """
+
+    def __init__(self, model_cls, elements):
+        self.model_cls = model_cls
+        self.elements = elements
+        self.start()
+        self.executor = ThreadPoolExecutor(1)  # requests to a worker are sent and answered one at a time
+        self.sessions = 0
+
+    def start(self):
+        self.connection, worker_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=session_worker, args=(worker_connection, self.model_cls, self.elements),
+                                               daemon=True)
+        self.process.start()
+        worker_connection.close()  # so that recv fails instead of blocking if the process dies
+
+    def restart(self):
+        self.connection.close()
+        self.process.join()
+        self.start()
+
+    def _request(self, message):
+        if not self.process.is_alive():
+            self.restart()
+        try:
+            self.connection.send(message)
+            return self.connection.recv()
+        except (EOFError, OSError) as error:
+            self.restart()
+            return 'error', 'the worker process died ({!r}) and has been restarted'.format(error)
+
+    async def request(self, *message):
+        status, result = await tornado.ioloop.IOLoop.current().run_in_executor(self.executor, self._request, message)
+        if status == 'error':
+            raise RuntimeError(result)
+        return result
+
+    def stop(self):
+        try:
+            self.connection.send(('stop',))
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join()
+        self.executor.shutdown()
+
+
+class Session():
+    """The parameters and model of one browser tab, the model itself lives in a worker process."""
+
+    def __init__(self, session_id, handler, worker, params):
+        self.id = session_id
+        self.handler = handler
+        self.worker = worker
+        self.params = params
+        self.lock = tornado.locks.Lock()  # the messages of a session are handled in order
+        self.last_active = time.monotonic()
+
+    async def reset(self):
+        return await self.worker.request('reset', self.id, self.params)
+
+    async def step(self):
+        return await self.worker.request('step', self.id, self.params)
+
+
+class SessionSocketHandler(SocketHandler):
+    """Gives each websocket connection its own session instead of sharing the server's model."""
+
+    session = None
+
+    def open(self):
+        self.session = self.application.open_session(self)
+        if self.session is None:
+            self.close(1013, 'The server is running the maximum number of sessions, please try again later.')
+            return
+        super().open()
+
+    def on_close(self):
+        if self.session is not None:
+            self.application.close_session(self.session)
+
+    async def on_message(self, message):
+        msg = tornado.escape.json_decode(message)
+        session = self.session
+        session.last_active = time.monotonic()
+
+        async with session.lock:
+            try:
+                if msg["type"] == "get_step":
+                    state = await session.step()
+                    if state is None:
+                        self.write_message({"type": "end"})
+                    else:
+                        self.write_message({"type": "viz_state", "data": state})
+
+                elif msg["type"] == "reset":
+                    self.write_message({"type": "viz_state", "data": await session.reset()})
+
+                elif msg["type"] == "submit_params":
+                    if msg["param"] in self.application.user_params:
+                        session.params[msg["param"]] = msg["value"]
+
+            except RuntimeError as error:
+                print('Session {}: {}'.format(session.id, error))
+                self.write_message({"type": "end"})
+            except tornado.websocket.WebSocketClosedError:
+                pass  # the session was closed while its model was stepping
+
+
+class SessionServer(ModularServer):
+    """A ModularServer that gives every browser tab its own model and runs the models in a pool of worker processes.
+
+    The models are stepped and rendered off the event loop, each worker owns the models of the sessions assigned to it
+    and frames are sent back as soon as they are ready, so a heavy session only slows down the sessions on its worker.
+    Sessions beyond max_sessions are turned away and sessions idle for idle_timeout seconds are closed.
+    """
+
+    verbose = False
+    socket_handler = (r"/ws", SessionSocketHandler)
+    handlers = [ModularServer.page_handler, socket_handler, ModularServer.static_handler, ModularServer.local_handler]
+
+    def __init__(self, model_cls, visualization_elements, name="Mesa Model", model_params={}, workers=None,
+                 max_sessions=40, idle_timeout=600):
+        self.num_workers = workers or os.cpu_count()
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.session_ids = itertools.count()
+        super().__init__(model_cls, visualization_elements, name, model_params)
+        self.workers = [SimulationWorker(model_cls, visualization_elements) for i in range(self.num_workers)]
+        self.evictor = None
+
+    def reset_model(self):
+        """ There is no shared model, each session creates its own """
+        self.model = None
+
+    def session_params(self):
+        """ Returns the current default parameter values, as ModularServer.reset_model passes them to the model """
+        params = {}
+        for key, val in self.model_kwargs.items():
+            if isinstance(val, UserSettableParameter):
+                if val.param_type == "static_text":
+                    continue
+                params[key] = val.value
+            else:
+                params[key] = val
+        return params
+
+    def open_session(self, handler):
+        """ Assigns a new session to the worker with the fewest sessions, or returns None if the server is full """
+        if len(self.sessions) >= self.max_sessions:
+            return None
+        worker = min(self.workers, key=lambda worker: worker.sessions)
+        worker.sessions += 1
+        session = Session(next(self.session_ids), handler, worker, self.session_params())
+        self.sessions[session.id] = session
+        return session
+
+    def close_session(self, session):
+        if self.sessions.pop(session.id, None) is not None:
+            session.worker.sessions -= 1
+            tornado.ioloop.IOLoop.current().spawn_callback(session.worker.request, 'close', session.id)
+
+    def evict_idle(self):
+        """ Closes the sessions that have not sent a message for idle_timeout seconds """
+        now = time.monotonic()
+        for session in list(self.sessions.values()):
+            if now - session.last_active > self.idle_timeout:
+                self.close_session(session)
+                session.handler.close(1000, 'Closed after {} seconds without activity.'.format(self.idle_timeout))
+
+    def start_eviction(self):
+        if self.evictor is None:
+            self.evictor = tornado.ioloop.PeriodicCallback(self.evict_idle, 1000 * min(self.idle_timeout, 60))
+            self.evictor.start()
+
+    def stop(self):
+        """ Stops the eviction timer and the worker processes """
+        if self.evictor is not None:
+            self.evictor.stop()
+            self.evictor = None
+        for worker in self.workers:
+            worker.stop()
+
+    def launch(self, port=None, open_browser=True):
+        print('Running up to {} sessions on {} workers'.format(self.max_sessions, self.num_workers))
+        self.start_eviction()
+        super().launch(port, open_browser)
@@ -0,0 +1,139 @@
+import json
+import os
+import time
+import unittest
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.websocket import websocket_connect
+from mesa.visualization.ModularVisualization import VisualizationElement
+from mesa.visualization.UserParam import UserSettableParameter
+from egypt_model import EgyptModel
+from egypt_server import SessionServer
+
+
+class TicksElement(VisualizationElement):
+
+    def render(self, model):
+        return model.ticks
+
+
+class CrashingModel(EgyptModel):
+    """Its worker process dies during the second step."""
+
+    def step(self):
+        if self.ticks == 1:
+            os._exit(1)
+        super().step()
+
+
+class TestSessionServer(AsyncHTTPTestCase):
+
+    def get_app(self):
+        self.server = SessionServer(EgyptModel, [TicksElement()], 'Egypt Model',
+                                    {'w': 31, 'h': 30, 'starting_households': 2,
+                                     'starting_settlements': UserSettableParameter('slider', 'starting_settlements', 3, 1, 10)},
+                                    workers=2, max_sessions=2, idle_timeout=600)
+        return self.server
+
+    def tearDown(self):
+        self.server.stop()
+        super().tearDown()
+
+    async def connect(self):
+        connection = await websocket_connect(self.get_url('/ws').replace('http', 'ws'))
+        message = json.loads(await connection.read_message())
+        self.assertEqual(message['type'], 'model_params')
+        return connection
+
+    async def send(self, connection, message):
+        await connection.write_message(json.dumps(message))
+        return json.loads(await connection.read_message())
+
+    @gen_test(timeout=30)
+    async def test_independent_sessions(self):
+        first = await self.connect()
+        second = await self.connect()
+        self.assertEqual(await self.send(first, {'type': 'reset'}), {'type': 'viz_state', 'data': [0]})
+        self.assertEqual(await self.send(second, {'type': 'reset'}), {'type': 'viz_state', 'data': [0]})
+
+        await self.send(first, {'type': 'get_step'})
+        self.assertEqual(await self.send(first, {'type': 'get_step'}), {'type': 'viz_state', 'data': [2]})
+        self.assertEqual(await self.send(second, {'type': 'get_step'}), {'type': 'viz_state', 'data': [1]})
+
+        # the sessions are spread over both workers
+        self.assertEqual([worker.sessions for worker in self.server.workers], [1, 1])
+
+    @gen_test(timeout=30)
+    async def test_params(self):
+        first = await self.connect()
+        second = await self.connect()
+        await first.write_message(json.dumps({'type': 'submit_params', 'param': 'starting_settlements', 'value': 5}))
+        await first.write_message(json.dumps({'type': 'submit_params', 'param': 'w', 'value': 5}))  # not user settable
+        await self.send(first, {'type': 'reset'})
+
+        # parameters only change for the session that submitted them
+        first_params, second_params = [session.params for session in self.server.sessions.values()]
+        self.assertEqual((first_params['starting_settlements'], first_params['w']), (5, 31))
+        self.assertEqual(second_params['starting_settlements'], 3)
+
+    @gen_test(timeout=30)
+    async def test_session_cap(self):
+        await self.connect()
+        await self.connect()
+        connection = await websocket_connect(self.get_url('/ws').replace('http', 'ws'))
+        self.assertIsNone(await connection.read_message())
+        self.assertEqual(connection.close_code, 1013)
+        self.assertEqual(len(self.server.sessions), 2)
+
+    @gen_test(timeout=30)
+    async def test_idle_eviction(self):
+        connection = await self.connect()
+        await self.send(connection, {'type': 'reset'})
+        self.server.idle_timeout = 0
+        time.sleep(0.01)
+        self.server.evict_idle()
+        self.assertIsNone(await connection.read_message())
+        self.assertEqual(len(self.server.sessions), 0)
+        self.assertEqual([worker.sessions for worker in self.server.workers], [0, 0])
+
+        # the freed slot can be used again
+        connection = await self.connect()
+        self.assertEqual(await self.send(connection, {'type': 'get_step'}), {'type': 'viz_state', 'data': [1]})
+
+
+class TestWorkerRestart(AsyncHTTPTestCase):
+
+    def get_app(self):
+        self.server = SessionServer(CrashingModel, [TicksElement()], 'Egypt Model', {'w': 31, 'h': 30, 'starting_households': 2},
+                                    workers=1, max_sessions=2)
+        return self.server
+
+    def tearDown(self):
+        self.server.stop()
+        super().tearDown()
+
+    @gen_test(timeout=30)
+    async def test_dead_worker(self):
+        connection = await websocket_connect(self.get_url('/ws').replace('http', 'ws'))
+        await connection.read_message()
+        await connection.write_message(json.dumps({'type': 'get_step'}))
+        self.assertEqual(json.loads(await connection.read_message()), {'type': 'viz_state', 'data': [1]})
+
+        # the worker dies while stepping: the session ends instead of the handler failing
+        await connection.write_message(json.dumps({'type': 'get_step'}))
+        self.assertEqual(json.loads(await connection.read_message()), {'type': 'end'})
+
+        # the worker has been restarted, the session starts over with a new model
+        await connection.write_message(json.dumps({'type': 'get_step'}))
+        self.assertEqual(json.loads(await connection.read_message()), {'type': 'viz_state', 'data': [1]})
+
+        # as does a worker that died between requests
+        self.server.workers[0].process.kill()
+        self.server.workers[0].process.join()
+        second = await websocket_connect(self.get_url('/ws').replace('http', 'ws'))
+        await second.read_message()
+        await second.write_message(json.dumps({'type': 'reset'}))
+        self.assertEqual(json.loads(await second.read_message()), {'type': 'viz_state', 'data': [0]})
+
+
+if __name__ == '__main__':
+    unittest.main()
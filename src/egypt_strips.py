@@ -0,0 +1,161 @@
+import bisect
+import multiprocessing
+import weakref
+import numpy as np
+from egypt_kernels import NumpyKernels, EMPTY
+
+
+def strip_worker(connection, ymin, ymax, width):
+    """
+    Runs in a worker process that owns the settlements in one strip of the grid. It keeps a copy of the fertility and
+    occupancy of its strip plus a halo of knowledge radius rows on either side (rows ymin up to ymax), which the model
+    brings up to date before each phase, and scans the knowledge radius of each of its settlements on request.
+    """
+    kernels = NumpyKernels()
+    fertility = np.zeros((ymax - ymin, width))
+    occupancy = np.full((ymax - ymin, width), EMPTY, dtype=np.int8)
+
+    while True:
+        message = connection.recv()
+
+        if message[0] == 'update':
+            _, fertility_rows, xs, ys, values = message
+            if fertility_rows is not None:
+                fertility[:] = fertility_rows
+            occupancy[ys - ymin, xs] = values
+
+        elif message[0] == 'claim':
+            _, positions, radius, limit = message
+            rankings = []
+            for x, y in positions:
+                xs, ys = kernels.claim_ranking(fertility, occupancy, x, y - ymin, radius, limit + 1)
+                rankings.append((xs, ys + ymin, len(xs) <= limit))  # the ranking is complete if it fits in limit cells
+            connection.send([(xs[:limit], ys[:limit], complete) for xs, ys, complete in rankings])
+
+        elif message[0] == 'rent':
+            _, positions, radius = message
+            fields = []
+            for x, y in positions:
+                xs, ys, field_fertility, distances = kernels.rental_fields(fertility, occupancy, x, y - ymin, radius)
+                fields.append((xs, ys + ymin, field_fertility, distances))
+            connection.send(fields)
+
+        elif message[0] == 'stop':
+            return
+
+
+def stop_workers(connections, processes):
+    for connection in connections:
+        try:
+            connection.send(('stop',))
+        except (BrokenPipeError, OSError):
+            pass
+    for process in processes:
+        process.join()
+
+
+class StripKernels(NumpyKernels):
+    """Splits the neighbourhood scans of a single model over worker processes that each own a strip of the grid.
+
+    The river runs along the y axis, so the grid is cut into strips of whole rows and every worker owns the settlements
+    whose rows fall in its strip. Before the claim and rent phases of each step the model sends every worker the
+    fertility and occupancy changes of its strip and halo, and the workers scan the knowledge radius of all of their
+    settlements in parallel. Households then make their claims and rentals one after another in the usual order,
+    using these scans instead of their own.
+
+    This gives the same results as the reference implementation. Cells are only ever taken during the claim phase,
+    so the first cell of a claim ranking that is still empty is the best claim. Fields do not change during the rent
+    phase. Whenever that does not hold, e.g. if the grid changed between a scan and its use, or a truncated claim ranking
+    runs out, the kernels fall back to scanning locally.
+    """
+
+    name = 'strips'
+
+    def __init__(self, strips=None, claim_limit=16):
+        self.strips = strips or multiprocessing.cpu_count()
+        self.claim_limit = claim_limit  # number of cells sent back per claim ranking
+        self.grid = None
+        self.claims = {}
+        self.rentals = {}
+
+    def start(self, grid, radius):
+        """ Starts a worker process for each strip """
+        self.grid = grid
+        self.radius = radius
+        self.strips = min(self.strips, grid.height)
+        self.bounds = [(i * grid.height // self.strips, (i + 1) * grid.height // self.strips) for i in range(self.strips)]
+        self.starts = [ymin for ymin, ymax in self.bounds]
+        self.halos = [(max(ymin - radius, 0), min(ymax + radius, grid.height)) for ymin, ymax in self.bounds]
+        self.connections = []
+        self.processes = []
+        for ymin, ymax in self.halos:
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=strip_worker, args=(worker_connection, ymin, ymax, grid.width), daemon=True)
+            process.start()
+            self.connections.append(connection)
+            self.processes.append(process)
+        self.finalizer = weakref.finalize(self, stop_workers, self.connections, self.processes)
+        # the worker copies start out empty
+        self.sent_fertility = np.zeros_like(grid.fertility)
+        self.sent_occupancy = np.full_like(grid.occupancy, EMPTY)
+
+    def close(self):
+        """ Stops the worker processes """
+        if self.grid is not None:
+            self.finalizer()
+
+    def strip_of(self, y):
+        """ Returns the strip whose bounds contain row y """
+        return bisect.bisect_right(self.starts, y) - 1
+
+    def send_updates(self):
+        """ Sends each worker the changes to its strip and halo since the last update """
+        fertility_changed = not np.array_equal(self.grid.fertility, self.sent_fertility)
+        ys, xs = np.nonzero(self.grid.occupancy != self.sent_occupancy)
+        for connection, (ymin, ymax) in zip(self.connections, self.halos):
+            in_halo = (ys >= ymin) & (ys < ymax)
+            connection.send(('update', self.grid.fertility[ymin:ymax] if fertility_changed else None,
+                             xs[in_halo], ys[in_halo], self.grid.occupancy[ys[in_halo], xs[in_halo]]))
+        self.sent_fertility[:] = self.grid.fertility
+        self.sent_occupancy[:] = self.grid.occupancy
+
+    def scan(self, positions, message):
+        """ Asks each worker to scan the positions in its strip, all workers scan in parallel """
+        by_strip = [[] for i in range(self.strips)]
+        for x, y in positions:
+            by_strip[self.strip_of(y)].append((x, y))
+        for connection, strip_positions in zip(self.connections, by_strip):
+            connection.send(message(strip_positions))
+        results = {}
+        for connection, strip_positions in zip(self.connections, by_strip):
+            results.update(zip(strip_positions, connection.recv()))
+        return results
+
+    def prepare(self, model, phase):
+        if self.grid is not model.grid or self.radius != model.knowledge_radius:
+            self.close()
+            self.start(model.grid, model.knowledge_radius)
+        self.send_updates()
+
+        positions = set(household.settlement.pos for household in model.households)
+        if phase == 'claim':
+            self.claims = self.scan(positions, lambda strip_positions: ('claim', strip_positions, self.radius, self.claim_limit))
+            self.claims_version = self.grid.release_version
+        elif phase == 'rent':
+            self.rentals = self.scan(positions, lambda strip_positions: ('rent', strip_positions, self.radius))
+            self.rentals_version = self.grid.version
+
+    def best_claim(self, fertility, occupancy, x, y, radius):
+        if (x, y) in self.claims and radius == self.radius and self.grid.release_version == self.claims_version:
+            xs, ys, complete = self.claims[(x, y)]
+            for i in range(len(xs)):
+                if occupancy[ys[i], xs[i]] == EMPTY:
+                    return int(xs[i]), int(ys[i])
+            if complete:
+                return None
+        return super().best_claim(fertility, occupancy, x, y, radius)
+
+    def rental_fields(self, fertility, occupancy, x, y, radius):
+        if (x, y) in self.rentals and radius == self.radius and self.grid.version == self.rentals_version:
+            return self.rentals[(x, y)]
+        return super().rental_fields(fertility, occupancy, x, y, radius)
@@ -0,0 +1,56 @@
+import argparse
+import egypt_model
+from egypt_model import EgyptModel
+
+
+def parse_value(value):
+    """ Converts a command line parameter value to the bool, int or float EgyptModel expects """
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def run(width, height, steps, seed=None, kernels='python', rng='python', **parameters):
+    """
+    Runs the model without the GUI for up to steps ticks, stopping early once no households are left
+    :return Returns the final tick count and reporter values
+    """
+    model = EgyptModel(width, height, kernels=kernels, seed=seed, rng=rng, **parameters)
+
+    while model.running and model.ticks < steps:
+        model.step()
+
+    return {
+        'ticks': model.ticks,
+        'gini': egypt_model.compute_gini(model),
+        'total-population': egypt_model.compute_total_population(model),
+        'total-wealth': egypt_model.compute_total_wealth(model)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs the model without the GUI and prints the final reporter values.')
+    parser.add_argument('grid_width', type=int)
+    parser.add_argument('grid_height', type=int)
+    parser.add_argument('steps', type=int)
+    parser.add_argument('parameters', nargs='*', help='EgyptModel parameters, e.g. knowledge_radius=10 allow_rental=true')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--kernels', default='python', choices=['python', 'numpy', 'jit', 'strips'])
+    parser.add_argument('--rng', default='python', choices=['python', 'numpy'])
+    args = parser.parse_intermixed_args(argv)
+
+    parameters = {}
+    for parameter in args.parameters:
+        name, _, value = parameter.partition('=')
+        parameters[name] = parse_value(value)
+
+    results = run(args.grid_width, args.grid_height, args.steps, seed=args.seed, kernels=args.kernels, rng=args.rng, **parameters)
+    for name, value in results.items():
+        print('{}: {}'.format(name, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+import argparse
+import json
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+from egypt_model import REPORTER_NAMES
+from sweep import OUTPUT_FILE, read_spec
+
+DESIGN_FILE = 'validation_output/design_spec.json'
+MORRIS_FILE = 'validation_output/morris.csv'
+
+
+def read_range_spec(path):
+    """
+    Reads a range spec, a sweep spec (see sweep.read_spec) that gives the range of each parameter instead of its values, e.g.
+    {"width": 31, "height": 30, "steps": 500, "replicates": 5, "seed": 1, "streams": true,
+     "design": "lhs", "samples": 40,
+     "ranges": {"knowledge_radius": [5, 40], "min_ambition": [0.0, 0.5], "allow_rental": [false, true]}}
+    Parameters with integer bounds only take integer values and parameters with boolean bounds are switched on in half
+    of the range. "design" is one of
+      lhs: a Latin hypercube of "samples" points
+      sobol: the first "samples" points of a scrambled Sobol sequence, best a power of two
+      morris: "trajectories" Morris trajectories on a grid of "levels" levels (default 4), each changing one parameter at a time
+    """
+    return read_spec(path)
+
+
+def latin_hypercube(samples, dimensions, seed=None):
+    return qmc.LatinHypercube(d=dimensions, seed=seed).random(samples)
+
+
+def sobol_sequence(samples, dimensions, seed=None):
+    return qmc.Sobol(d=dimensions, scramble=True, seed=seed).random(samples)
+
+
+def morris_trajectories(trajectories, dimensions, levels=4, seed=None):
+    """
+    Returns Morris trajectories in the unit cube, each of dimensions + 1 consecutive points that move one coordinate at a
+    time by delta = levels / (2 * (levels - 1)), in random order and direction
+    """
+    rng = np.random.default_rng(seed)
+    delta = levels / (2 * (levels - 1))
+    grid = np.arange(levels) / (levels - 1)
+    lower_starts = grid[grid <= 1 - delta + 1e-12]
+    upper_starts = grid[grid >= delta - 1e-12]
+
+    points = []
+    for i in range(trajectories):
+        up = rng.random(dimensions) < 0.5
+        x = np.where(up, rng.choice(lower_starts, dimensions), rng.choice(upper_starts, dimensions))
+        points.append(x.copy())
+        for d in rng.permutation(dimensions):
+            x[d] += delta if up[d] else -delta
+            points.append(x.copy())
+    return np.array(points)
+
+
+def scale(unit, ranges):
+    """ Maps points in the unit cube to parameter point dicts within the ranges """
+    names = sorted(ranges)
+    points = []
+    for u in unit:
+        point = {}
+        for name, value in zip(names, u):
+            lower, upper = ranges[name]
+            if isinstance(lower, bool) and isinstance(upper, bool):
+                point[name] = bool(value >= 0.5) if lower != upper else lower
+            elif isinstance(lower, int) and isinstance(upper, int):
+                point[name] = int(round(lower + value * (upper - lower)))
+            else:
+                point[name] = float(lower + value * (upper - lower))
+        points.append(point)
+    return points
+
+
+def design_spec(spec):
+    """ Returns a sweep spec with the parameter points of the design described by a range spec """
+    names = sorted(spec['ranges'])
+    seed = spec.get('seed')
+    if spec['design'] == 'lhs':
+        unit = latin_hypercube(spec['samples'], len(names), seed)
+    elif spec['design'] == 'sobol':
+        unit = sobol_sequence(spec['samples'], len(names), seed)
+    elif spec['design'] == 'morris':
+        unit = morris_trajectories(spec['trajectories'], len(names), spec.get('levels', 4), seed)
+    else:
+        raise ValueError("unknown design '{}', expected 'lhs', 'sobol' or 'morris'".format(spec['design']))
+
+    design = {key: value for key, value in spec.items() if key not in ('parameters', 'points')}
+    design['points'] = scale(unit, spec['ranges'])
+    return design
+
+
+def elementary_effects(spec, data):
+    """
+    Computes the Morris elementary effects of each parameter on each reporter from the results of a Morris design,
+    using the mean over the replicates of each point (with common random numbers the replicates cancel out in the effects)
+    :return Returns a data frame indexed by reporter and parameter with the mean effect mu, the mean absolute effect mu_star
+    and the standard deviation sigma of the effects, in reporter units per whole parameter range
+    """
+    names = sorted(spec['ranges'])
+    lower = np.array([float(spec['ranges'][name][0]) for name in names])
+    upper = np.array([float(spec['ranges'][name][1]) for name in names])
+    unit = (np.array([[float(point[name]) for name in names] for point in spec['points']]) - lower) / (upper - lower)
+    means = data.groupby('point')[REPORTER_NAMES].mean().reindex(range(len(unit))).values
+
+    effects = {(output, name): [] for output in REPORTER_NAMES for name in names}
+    length = len(names) + 1
+    for start in range(0, len(unit) - length + 1, length):
+        for i in range(start, start + length - 1):
+            step = unit[i + 1] - unit[i]
+            d = int(np.argmax(np.abs(step)))
+            if step[d] == 0 or np.isnan(means[i]).any() or np.isnan(means[i + 1]).any():
+                continue  # rounding an integer parameter left it unchanged, or a point has no results
+            for j, output in enumerate(REPORTER_NAMES):
+                effects[(output, names[d])].append((means[i + 1, j] - means[i, j]) / step[d])
+
+    rows = []
+    for (output, name), values in effects.items():
+        values = np.array(values)
+        rows.append({'reporter': output, 'parameter': name, 'effects': len(values),
+                     'mu': values.mean() if len(values) else np.nan,
+                     'mu_star': np.abs(values).mean() if len(values) else np.nan,
+                     'sigma': values.std(ddof=1) if len(values) > 1 else np.nan})
+    return pd.DataFrame(rows).set_index(['reporter', 'parameter'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds experiment designs from parameter ranges and analyses their results.')
+    parser.add_argument('mode', choices=['design', 'morris'],
+                        help='design: write a sweep spec with the points of the design in a range spec, '
+                             'morris: compute the elementary effects from the sweep results of a Morris design')
+    parser.add_argument('--spec', required=True, help='range spec in design mode, the design spec in morris mode')
+    parser.add_argument('--sweep', default=OUTPUT_FILE, help='sweep results of the design, in morris mode')
+    parser.add_argument('--output', help='design spec to write (design mode) or elementary effects csv (morris mode)')
+    args = parser.parse_args()
+
+    if args.mode == 'design':
+        with open(args.output or DESIGN_FILE, 'w') as f:
+            json.dump(design_spec(read_range_spec(args.spec)), f, indent=2)
+
+    elif args.mode == 'morris':
+        effects = elementary_effects(read_spec(args.spec), pd.read_csv(args.sweep, delimiter=',', skipinitialspace=True))
+        effects.to_csv(args.output or MORRIS_FILE)
+        print(effects.to_string())
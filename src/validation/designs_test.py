@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+import pandas as pd
+import designs
+
+
+class TestDesigns(unittest.TestCase):
+
+    def test_morris_trajectories(self):
+        levels = 4
+        delta = levels / (2 * (levels - 1))
+        points = designs.morris_trajectories(10, 3, levels, seed=1)
+        self.assertEqual(points.shape, (10 * 4, 3))
+        self.assertTrue(((points >= 0) & (points <= 1)).all())
+
+        # each step of a trajectory moves exactly one coordinate by delta, and each coordinate moves once per trajectory
+        for trajectory in points.reshape(10, 4, 3):
+            steps = np.diff(trajectory, axis=0)
+            moved = np.abs(steps) > 1e-12
+            np.testing.assert_array_equal(moved.sum(axis=1), [1, 1, 1])
+            np.testing.assert_array_equal(moved.sum(axis=0), [1, 1, 1])
+            np.testing.assert_allclose(np.abs(steps[moved]), delta)
+
+    def test_scale(self):
+        ranges = {'allow_rental': [False, True], 'knowledge_radius': [5, 40], 'min_ambition': [0.0, 0.5],
+                  'streams': [True, True]}
+        points = designs.scale(np.array([[0.0, 0.0, 0.0, 0.0], [0.49, 0.5, 0.5, 0.7], [1.0, 1.0, 1.0, 1.0]]), ranges)
+        self.assertEqual(points, [
+            {'allow_rental': False, 'knowledge_radius': 5, 'min_ambition': 0.0, 'streams': True},
+            {'allow_rental': False, 'knowledge_radius': 22, 'min_ambition': 0.25, 'streams': True},
+            {'allow_rental': True, 'knowledge_radius': 40, 'min_ambition': 0.5, 'streams': True}])
+        self.assertIsInstance(points[1]['knowledge_radius'], int)
+        self.assertIsInstance(points[1]['min_ambition'], float)
+
+    def test_elementary_effects(self):
+        # a response that is linear in each parameter has an effect of its slope times the range, whatever the trajectory
+        spec = designs.design_spec({'design': 'morris', 'trajectories': 6, 'seed': 1,
+                                    'ranges': {'knowledge_radius': [5.0, 40.0], 'min_ambition': [0.0, 0.5]}})
+        rows = []
+        for point, parameters in enumerate(spec['points']):
+            for replicate in range(2):
+                rows.append({'point': point, 'replicate': replicate,
+                             'gini': 0.01 * parameters['knowledge_radius'] - 0.2 * parameters['min_ambition'],
+                             'total-population': 500.0, 'total-wealth': 1000.0 * parameters['min_ambition']})
+
+        effects = designs.elementary_effects(spec, pd.DataFrame(rows))
+        self.assertEqual(effects.loc[('gini', 'knowledge_radius'), 'effects'], 6)
+        np.testing.assert_allclose(effects.loc[('gini', 'knowledge_radius'), ['mu', 'mu_star', 'sigma']], [0.35, 0.35, 0], atol=1e-12)
+        np.testing.assert_allclose(effects.loc[('gini', 'min_ambition'), ['mu', 'mu_star', 'sigma']], [-0.1, 0.1, 0], atol=1e-12)
+        np.testing.assert_allclose(effects.loc[('total-wealth', 'min_ambition'), 'mu'], 500)
+        np.testing.assert_allclose(effects.loc[('total-population', 'knowledge_radius'), 'mu_star'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
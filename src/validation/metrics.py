@@ -0,0 +1,254 @@
+import argparse
+import json
+import os
+import resource
+import socket
+import threading
+import time
+
+METRICS_DIR = 'validation_output/metrics'
+METRICS_FILE = 'validation_output/metrics.json'
+
+# the metrics of the simulations run by this process, set up by start_worker
+worker = None
+
+
+def write_json(path, data):
+    """ Replaces a JSON file atomically, so that readers never see a partly written file """
+    temp_path = '{}.{}-{}.tmp'.format(path, socket.gethostname(), os.getpid())
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def resident_memory():
+    """ Returns the resident set size of this process in bytes, or its peak where /proc is not available """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class WorkerMetrics():
+    """Rewrites a status file for one worker process every interval seconds from a heartbeat thread, also while a single
+    tick takes longer than that, so that a status only goes stale once its process has gone."""
+
+    def __init__(self, directory, interval=10):
+        self.directory = directory
+        self.interval = interval
+        self.name = '{}-{}'.format(socket.gethostname(), os.getpid())
+        self.path = os.path.join(directory, self.name + '.json')
+        self.runs_completed = 0
+        self.ticks = 0  # ticks of completed runs
+        self.busy = 0.0  # seconds spent stepping models
+        self.run_in_progress = None  # the model in progress, its label, parameters and steps, and its start time and tick
+        # time and total ticks at the start of the previous and the current interval, the rate is measured since the former
+        self.window = [(time.monotonic(), 0)] * 2
+        self.lock = threading.Lock()  # the heartbeat and the stepping thread both write the status file
+        self.stopped = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+
+    def current(self, now):
+        """ Returns the progress of the model in progress, or None """
+        if self.run_in_progress is None:
+            return None
+        model, label, parameters, steps, start, start_ticks = self.run_in_progress
+        elapsed = now - start
+        return {
+            'label': label,
+            'parameters': parameters,
+            'ticks': model.ticks,
+            'steps': steps,
+            'elapsed': elapsed,
+            'ticks_per_second': (model.ticks - start_ticks) / elapsed if elapsed else 0.0,
+            'households': len(model.households),
+            'fields': len(model.fields)
+        }
+
+    def status(self):
+        # the throughput over the last one or two intervals, idle time included, rather than since the worker started
+        now = time.monotonic()
+        ticks = self.ticks
+        if self.run_in_progress is not None:
+            model, start_ticks = self.run_in_progress[0], self.run_in_progress[5]
+            ticks += model.ticks - start_ticks
+        if now - self.window[1][0] >= self.interval:
+            self.window = [self.window[1], (now, ticks)]
+        last_time, last_ticks = self.window[0]
+        return {
+            'worker': self.name,
+            'updated': time.time(),
+            'rss': resident_memory(),
+            'runs_completed': self.runs_completed,
+            'ticks_per_second': (ticks - last_ticks) / (now - last_time) if now > last_time else 0.0,
+            'mean_ticks_per_second': self.ticks / self.busy if self.busy else 0.0,
+            'current': self.current(now)
+        }
+
+    def write(self):
+        with self.lock:
+            write_json(self.path, self.status())
+
+    def heartbeat(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def start(self):
+        """ Writes the status now and then every interval seconds until the process exits or stop is called """
+        self.write()
+        threading.Thread(target=self.heartbeat, daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self, model, steps, label, parameters=None, observe=None):
+        """ Steps a model until it stops or reaches steps ticks, the heartbeat reports its progress along the way """
+        start = time.monotonic()
+        start_ticks = model.ticks
+        with self.lock:
+            self.run_in_progress = (model, label, parameters, steps, start, start_ticks)
+        self.write()
+        if observe is not None:
+            observe(model)
+        while model.running and model.ticks < steps:
+            model.step()
+            if observe is not None:
+                observe(model)
+
+        with self.lock:
+            self.busy += time.monotonic() - start
+            self.ticks += model.ticks - start_ticks
+            self.runs_completed += 1
+            self.run_in_progress = None
+        self.write()
+
+
+def start_worker(directory=METRICS_DIR, interval=10):
+    """ Reports the metrics of the simulations this process runs, e.g. as the initializer of a multiprocessing.Pool """
+    global worker
+    worker = WorkerMetrics(directory, interval)
+    worker.start()
+
+
+def run_model(model, steps, label, parameters=None, observe=None):
+    """
+    Steps a model until it stops or reaches steps ticks, reporting its progress if this process has started a worker
+    :param observe: called with the model before the first step and after every step, e.g. to record reporters
+    """
+    if worker is None:
+        if observe is not None:
+            observe(model)
+        while model.running and model.ticks < steps:
+            model.step()
+            if observe is not None:
+                observe(model)
+    else:
+        worker.run(model, steps, label, parameters, observe)
+
+
+def read_workers(directory):
+    workers = []
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(directory, name), 'r') as f:
+                    workers.append(json.load(f))
+            except (OSError, ValueError):
+                pass  # the file was being replaced
+    return workers
+
+
+def summary(directory, counts, interval=10, slowest=5):
+    """
+    Combines the status files of the workers with the run counts given by counts(). For a local batch that is just
+    the number of runs in total (if known), and the runs completed and queued are worked out from the workers.
+    :return Returns a dict of the throughput, the status of every worker, the models in flight and the slowest of them
+    """
+    now = time.time()
+    workers = read_workers(directory)
+    for status in workers:
+        # the heartbeat of a live worker rewrites its status every interval, even during a long tick, so a status that has
+        # not been written for a while belongs to a worker that has exited or died, e.g. in an earlier session
+        status['stale'] = now - status['updated'] > 3 * max(interval, 1)
+
+    in_flight = [dict(status['current'], worker=status['worker']) for status in workers
+                 if status['current'] is not None and not status['stale']]
+    run_counts = counts()
+    if 'runs_completed' not in run_counts:
+        run_counts['runs_completed'] = sum(status['runs_completed'] for status in workers)
+        if 'runs_total' in run_counts:
+            run_counts['runs_queued'] = run_counts['runs_total'] - run_counts['runs_completed'] - len(in_flight)
+    return dict(run_counts, **{
+        'updated': now,
+        'ticks_per_second': sum(status['ticks_per_second'] for status in workers if not status['stale']),
+        'workers': workers,
+        'in_flight': in_flight,
+        'slowest': sorted(in_flight, key=lambda current: current['ticks_per_second'])[:slowest]
+    })
+
+
+def queue_counts(queue):
+    """ Returns a counts function for summary that counts the runs in a work queue """
+    def counts():
+        counts = queue.counts()
+        return {'runs_total': sum(counts.values()), 'runs_completed': counts['done'], 'runs_queued': counts['pending'],
+                'runs_leased': counts['leased']}
+    return counts
+
+
+class MetricsWriter():
+    """Rewrites the metrics file every interval seconds from a background thread while a runner waits for its workers."""
+
+    def __init__(self, path=METRICS_FILE, directory=METRICS_DIR, counts=None, interval=10, clear=True):
+        self.path = path
+        self.directory = directory
+        self.counts = counts or (lambda: {})
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+        if clear:
+            # status files left over from an earlier run
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+
+    def write(self):
+        write_json(self.path, summary(self.directory, self.counts, self.interval))
+
+    def loop(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+        self.write()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prints the live metrics written by the sweep and validation runners.')
+    parser.add_argument('path', nargs='?', default=METRICS_FILE)
+    parser.add_argument('--watch', type=float, help='print the metrics again every WATCH seconds')
+    args = parser.parse_args()
+
+    while True:
+        with open(args.path, 'r') as f:
+            metrics = json.load(f)
+        print('{} completed, {} queued, {:.1f} ticks/s over {} workers'.format(
+            metrics.get('runs_completed'), metrics.get('runs_queued'), metrics['ticks_per_second'], len(metrics['workers'])))
+        for status in metrics['workers']:
+            print('  {}: {} runs, {:.1f} ticks/s, {:.0f} MB{}'.format(status['worker'], status['runs_completed'],
+                                                                   status['ticks_per_second'], status['rss'] / 2 ** 20,
+                                                                   ' (stale)' if status['stale'] else ''))
+        for current in metrics['slowest']:
+            print('  slow: {} at tick {}/{}, {:.1f} ticks/s, {} households, {} fields'.format(
+                current['label'], current['ticks'], current['steps'], current['ticks_per_second'],
+                current['households'], current['fields']))
+        if args.watch is None:
+            break
+        time.sleep(args.watch)
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+import metrics
+
+
+class TestSummary(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_status(self, name, age, ticks_per_second, current=None):
+        metrics.write_json(os.path.join(self.directory.name, name + '.json'), {
+            'worker': name, 'updated': time.time() - age, 'rss': 0, 'runs_completed': 1,
+            'ticks_per_second': ticks_per_second, 'mean_ticks_per_second': ticks_per_second, 'current': current})
+
+    def test_stale_workers(self):
+        # workers that have not reported for a few intervals no longer count, whether or not they were running a model
+        self.write_status('active', 1, 10.0, {'label': 'a', 'ticks_per_second': 10.0})
+        self.write_status('idle', 100, 20.0)
+        self.write_status('crashed', 100, 30.0, {'label': 'b', 'ticks_per_second': 30.0})
+        summary = metrics.summary(self.directory.name, lambda: {'runs_total': 10}, interval=10)
+        self.assertEqual(summary['ticks_per_second'], 10.0)
+        self.assertEqual([current['label'] for current in summary['in_flight']], ['a'])
+        self.assertEqual(summary['runs_completed'], 3)
+        self.assertEqual(summary['runs_queued'], 6)
+
+    def test_recent_rate(self):
+        # a worker's rate covers its recent intervals, not its lifetime
+        worker = metrics.WorkerMetrics(self.directory.name, interval=0.05)
+        worker.ticks = 100
+        worker.busy = 1.0
+        time.sleep(0.06)
+        worker.status()
+        time.sleep(0.06)
+        status = worker.status()
+        self.assertEqual(status['mean_ticks_per_second'], 100.0)
+        self.assertEqual(status['ticks_per_second'], 0.0)
+
+    def test_long_tick(self):
+        # a model in the middle of a tick several intervals long is still in flight, and among the slowest
+        class SlowModel():
+            ticks = 0
+            running = True
+            households = []
+            fields = []
+
+            def step(self):
+                time.sleep(0.5)
+                self.ticks += 1
+
+        worker = metrics.WorkerMetrics(self.directory.name, interval=0.05)
+        worker.start()
+        thread = threading.Thread(target=worker.run, args=(SlowModel(), 1, 'slow'))
+        thread.start()
+        try:
+            time.sleep(0.3)
+            summary = metrics.summary(self.directory.name, lambda: {}, interval=0.05)
+            self.assertEqual([status['stale'] for status in summary['workers']], [False])
+            self.assertEqual([current['label'] for current in summary['slowest']], ['slow'])
+        finally:
+            thread.join()
+            worker.stop()
+        self.assertIsNone(worker.status()['current'])
+        self.assertEqual(worker.runs_completed, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,12 @@
+import argparse
+import os
 import numpy as np
 import pandas as pd
 import statsmodels.api as sm
 import math
-from matplotlib import pyplot as plt
+
+OUTPUT_FILE = 'validation_output/output.csv'
+MEANS_FILE = 'validation_output/output_means.csv'  # cache of the per-parameter-set means of OUTPUT_FILE
 
 metric_pairs = [
     ('python-total-population', 'netlogo-total-population'),
@@ -16,56 +20,90 @@ def compare(O, E):
     return (O - E) / E
 
 
-# read csv file
-data = pd.read_csv('validation_output/output.csv', delimiter=',', skipinitialspace=True)
-
-feature_column_names = data.keys()[1:11]
-
-# when there are numerous repeats of each set of parameters/features take the mean of the results from each set
-groups = data.groupby(list(feature_column_names), as_index=False)
-data = groups.mean()
-
-# numpy array of X values for regression
-X = data[feature_column_names].values
-
-# remove features that were never changed (e.g. if only one value for starting-households was tested)
-feature_column_names = feature_column_names[X.std(axis=0) != 0]
-X = X[:, X.std(axis=0) != 0]
-
-# normalise X values
-X = (X - X.mean(axis=0)) / X.std(axis=0)
-
-# set up plot
-fig, ax = plt.subplots(2, len(metric_pairs), sharex='col', sharey='row', figsize=plt.figaspect(0.55))
-ax[1][0].set_ylabel('-log(p-value)')
-ax[0][0].set_ylabel('coefficient')
-
-for i, metric_pair in enumerate(metric_pairs):
-    # numpy array of Y values for regression
-    Y = compare(data[metric_pair[0]].values, data[metric_pair[1]].values)
-    
-    # Normalise Y values
-    Y = (Y - Y.mean(axis=0)) / Y.std(axis=0)
-    
-    # run regression
-    est = sm.OLS(Y, sm.add_constant(X)).fit()
-    
-    # remove p-values and coefficients for the regression constant
-    p_values = est.pvalues[np.array(est.model.data.param_names) != 'const']
-    parameters = est.params[np.array(est.model.data.param_names) != 'const']
-    
-    # -log(p-value)
-    lp = [-math.log10(pv) for pv in p_values]
-    
-    # plot results
-    ax[0][i].set_title(metric_pair[0] + '/\n' + metric_pair[1])
-    ax[0][i].scatter(range(len(lp)), parameters)
-    ax[0][i].axhline(y=0, color='r', linestyle='--')
-    ax[1][i].scatter(range(len(lp)), lp)
-    ax[1][i].set_xticks(range(len(lp)))
-    ax[1][i].set_xticklabels(feature_column_names, rotation=270)
-
-plt.tight_layout()
-plt.subplots_adjust(wspace=0.4)
-plt.savefig('validation_output/regression.pdf', format='pdf')
-plt.show()
+def aggregate(path, chunksize=100000):
+    """
+    Streams a csv file in chunks and keeps running per-group sums and counts of the non-missing values of each column, so that
+    files larger than memory can be aggregated
+    :return Returns a data frame with the mean of every numeric column for each set of parameters/features,
+    the same as data.groupby(features).mean() on the whole file
+    """
+    columns = list(pd.read_csv(path, delimiter=',', skipinitialspace=True, nrows=0).keys())
+    feature_column_names = columns[1:11]
+
+    sums = None
+    counts = None
+    for chunk in pd.read_csv(path, delimiter=',', skipinitialspace=True, chunksize=chunksize):
+        values = chunk.drop(columns=feature_column_names).select_dtypes('number')
+        groups = values.groupby([chunk[name] for name in feature_column_names])
+        if sums is None:
+            sums, counts = groups.sum(), groups.count()
+        else:
+            sums, counts = sums.add(groups.sum(), fill_value=0), counts.add(groups.count(), fill_value=0)
+
+    means = sums.div(counts).reset_index()
+    return means[[column for column in columns if column in means]]
+
+
+def read_means(refresh=False):
+    """ Returns the per-parameter-set means of the output file, recomputing the cache if the output file is newer """
+    if refresh or not os.path.exists(MEANS_FILE) or os.path.getmtime(MEANS_FILE) < os.path.getmtime(OUTPUT_FILE):
+        aggregate(OUTPUT_FILE).to_csv(MEANS_FILE, index=False)
+    return pd.read_csv(MEANS_FILE)
+
+
+if __name__ == '__main__':
+    from matplotlib import pyplot as plt
+
+    parser = argparse.ArgumentParser(description='Regresses the difference between the Python and NetLogo results on the model parameters.')
+    parser.add_argument('--refresh', action='store_true', help='recompute the cached means even if output.csv has not changed')
+    args = parser.parse_args()
+
+    # when there are numerous repeats of each set of parameters/features take the mean of the results from each set
+    data = read_means(args.refresh)
+
+    feature_column_names = data.keys()[1:11]
+
+    # numpy array of X values for regression
+    X = data[feature_column_names].values
+
+    # remove features that were never changed (e.g. if only one value for starting-households was tested)
+    feature_column_names = feature_column_names[X.std(axis=0) != 0]
+    X = X[:, X.std(axis=0) != 0]
+
+    # normalise X values
+    X = (X - X.mean(axis=0)) / X.std(axis=0)
+
+    # set up plot
+    fig, ax = plt.subplots(2, len(metric_pairs), sharex='col', sharey='row', figsize=plt.figaspect(0.55))
+    ax[1][0].set_ylabel('-log(p-value)')
+    ax[0][0].set_ylabel('coefficient')
+
+    for i, metric_pair in enumerate(metric_pairs):
+        # numpy array of Y values for regression
+        Y = compare(data[metric_pair[0]].values, data[metric_pair[1]].values)
+
+        # Normalise Y values
+        Y = (Y - Y.mean(axis=0)) / Y.std(axis=0)
+
+        # run regression
+        est = sm.OLS(Y, sm.add_constant(X)).fit()
+
+        # remove p-values and coefficients for the regression constant
+        p_values = est.pvalues[np.array(est.model.data.param_names) != 'const']
+        parameters = est.params[np.array(est.model.data.param_names) != 'const']
+
+        # -log(p-value)
+        lp = [-math.log10(pv) for pv in p_values]
+
+        # plot results
+        ax[0][i].set_title(metric_pair[0] + '/\n' + metric_pair[1])
+        ax[0][i].scatter(range(len(lp)), parameters)
+        ax[0][i].axhline(y=0, color='r', linestyle='--')
+        ax[1][i].scatter(range(len(lp)), lp)
+        ax[1][i].set_xticks(range(len(lp)))
+        ax[1][i].set_xticklabels(feature_column_names, rotation=270)
+
+    plt.tight_layout()
+    plt.subplots_adjust(wspace=0.4)
+    plt.savefig('validation_output/regression.pdf', format='pdf')
+    plt.show()
@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import regression
+
+
+class TestAggregate(unittest.TestCase):
+
+    def test_chunked_means(self):
+        # the chunked means are the same as the means of the whole file, including columns with missing values
+        rng = np.random.default_rng(1)
+        data = pd.DataFrame({'[run number]': range(1, 31)})
+        for i in range(10):
+            data['feature-{}'.format(i)] = rng.integers(0, 2, 30) if i < 2 else 1
+        data['python-gini'] = rng.random(30)
+        data['python-total-wealth'] = np.where(rng.random(30) < 0.3, np.nan, rng.random(30))
+        features = list(data.columns[1:11])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'output.csv')
+            data.to_csv(path, index=False)
+            expected = data.groupby(features).mean().reset_index()
+            for chunksize in (1, 7, 100):
+                means = regression.aggregate(path, chunksize=chunksize)
+                pd.testing.assert_frame_equal(means.drop(columns='[run number]'),
+                                              expected.drop(columns='[run number]'), check_dtype=False)
+
+    def test_missing_values(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'output.csv')
+            with open(path, 'w') as f:
+                f.write(', '.join(['[run number]'] + ['feature-{}'.format(i) for i in range(10)] + ['python-gini']) + '\n')
+                for run, gini in enumerate(['0.25', '', '0.75']):
+                    f.write(', '.join([str(run)] + ['1'] * 10 + [gini]) + '\n')
+            self.assertEqual(regression.aggregate(path, chunksize=1)['python-gini'][0], 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,63 +1,67 @@
+import argparse
 import csv
+from functools import partial
+from multiprocessing import shared_memory
+import numpy as np
 from egypt_model import EgyptModel
 import multiprocessing
 import egypt_model
+import metrics
+import work_queue
+from work_queue import DirectoryQueue
 
-data = []
+NETLOGO_TABLE = 'validation_output/revised Egypt model 2019 no GIS Capstone-table.csv'
+OUTPUT_FILE = 'validation_output/output.csv'
+SERIES_FILE = 'validation_output/series.npz'
 
-with open('validation_output/revised Egypt model 2019 no GIS Capstone-table.csv', 'r') as file:
-    reader = csv.reader(file, skipinitialspace=True)
-    for line in reader:
-        data.append(line)
+# the result block this process writes into, attached by start_series_worker
+block = None
 
-# read grid size from NetLogo generated file
-width = int(data[5][1]) - int(data[5][0])  # max-pxcor - min-pxcor
-height = int(data[5][3]) - int(data[5][2])  # max-pycar - min-pycor
 
-headings = data[6]
-data = data[7:]  # "real" data is from row 7 onwards
+def read_netlogo_table(path):
+    """
+    Reads a NetLogo BehaviorSpace table one row at a time
+    :return Returns the grid width and height, the column headings and, for each run, the row of its final step
+    """
+    with open(path, 'r') as file:
+        reader = csv.reader(file, skipinitialspace=True)
+        header = [next(reader) for i in range(7)]
 
-run_index = headings.index('[run number]')
-step_index = headings.index('[step]')
+        # read grid size from NetLogo generated file
+        width = int(header[5][1]) - int(header[5][0])  # max-pxcor - min-pxcor
+        height = int(header[5][3]) - int(header[5][2])  # max-pycar - min-pycor
 
-# NetLogo generates csv rows for every step in every simulation
-# We only want the final step of each simulation
-# Therefore, for each unique set of parameters keep only the run with the highest step number
+        headings = header[6]  # "real" data is from row 7 onwards
 
-temp = {}
+        run_index = headings.index('[run number]')
+        step_index = headings.index('[step]')
 
-for row in data:
-    row[run_index] = int(row[run_index])
-    row[step_index] = int(row[step_index])
-    run = row[run_index]
-    if run in temp:
-        if temp[run][step_index] < row[step_index]:
-            temp[run] = row
-    else:
-        temp[run] = row
+        # NetLogo generates csv rows for every step in every simulation
+        # We only want the final step of each simulation
+        # Therefore, for each unique set of parameters keep only the run with the highest step number
 
-runs = []
-for key in sorted(temp):
-    runs.append(temp[key])
+        temp = {}
 
-# output file to save results to
+        for row in reader:
+            row[run_index] = int(row[run_index])
+            row[step_index] = int(row[step_index])
+            run = row[run_index]
+            if run in temp:
+                if temp[run][step_index] < row[step_index]:
+                    temp[run] = row
+            else:
+                temp[run] = row
 
-f = open('validation_output/output.csv', 'w')
+    runs = []
+    for key in sorted(temp):
+        runs.append(temp[key])
 
-f.write(', '.join(headings[:step_index + 1] + ['python-gini', 'netlogo-gini-index-reserve', 'python-total-population',
-                                               'netlogo-total-population', 'python-total-wealth',
-                                               'netlogo-total-wealth']) + '\n')
+    return width, height, headings, runs
 
 
-def simulate(run):
-    """
-    Runs a simulation with the parameters specified in the 'run' row from NetLogo generated csv file
-    :return Returns an array containing the parameters and results of the Python and NetLogo simulations
-    """
-    # read simulation parameters from "run" row taken from csv
-    model = EgyptModel(
-        w=width,
-        h=height,
+def model_parameters(run, headings):
+    """ Returns the EgyptModel keyword arguments for the parameters in the 'run' row from NetLogo generated csv file """
+    return dict(
         starting_settlements=int(run[headings.index('starting-settlements')]),
         starting_households=int(run[headings.index('starting-households')]),
         starting_household_size=int(run[headings.index('starting-household-size')]),
@@ -72,30 +76,190 @@ def simulate(run):
         land_rental_rate=int(run[headings.index('land-rental-rate')])/100,
         allow_rental=run[headings.index('allow-land-rental?')] == 'true'
     )
-    
+
+
+def simulate(run, headings, width, height):
+    """
+    Runs a simulation with the parameters specified in the 'run' row from NetLogo generated csv file
+    :return Returns an array containing the parameters and results of the Python and NetLogo simulations
+    """
+    step_index = headings.index('[step]')
+
+    # read simulation parameters from "run" row taken from csv
+    parameters = model_parameters(run, headings)
+    model = EgyptModel(w=width, h=height, **parameters)
+
     num_steps = int(run[step_index])
-    
-    for i in range(num_steps):
-        model.step()
-    
-    python_gini = egypt_model.compute_gini(model)
-    python_population = egypt_model.compute_total_population(model)
-    python_wealth = egypt_model.compute_total_wealth(model)
-    
+
+    # stop early once the model can no longer change, the final reporter values are already settled
+    metrics.run_model(model, num_steps, 'run-{}'.format(run[headings.index('[run number]')]), parameters)
+
+    python_gini, python_population, python_wealth = egypt_model.compute_reporters(model)
+
     netlogo_gini = float(run[headings.index('gini-index-reserve / total-households / 0.5')])
     netlogo_population = int(run[headings.index('total-population')])
     netlogo_wealth = float(run[headings.index('total-grain')])
-    
+
     # append results to the row containing the parameters
     return run[:step_index + 1] + [python_gini, netlogo_gini, python_population, netlogo_population, python_wealth,
                                    netlogo_wealth]
 
-# use multiprocessing to speed up the process by running simulations in parallel.
-p = multiprocessing.Pool(multiprocessing.cpu_count())
-results = p.map(simulate, runs)
 
-# write the results to a file
-for result in results:
-    f.write(', '.join([str(x) for x in result]) + '\n')
+class ResultBlock():
+    """
+    The reporters of every run at every tick, and at the final step, in NumPy arrays indexed by run that live in one shared
+    memory block, so that worker processes can write their results in place instead of sending them back to the parent.
+    The parent creates the block, the workers attach to it by name.
+    """
+
+    def __init__(self, runs, ticks, name=None):
+        self.runs = runs
+        self.ticks = ticks
+        series_shape = (runs, ticks + 1, len(egypt_model.REPORTERS))
+        final_shape = (runs, len(egypt_model.REPORTERS))
+        size = 8 * (np.prod(series_shape) + np.prod(final_shape))
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=int(size))
+        self.series = np.ndarray(series_shape, dtype=np.float64, buffer=self.memory.buf)
+        self.final = np.ndarray(final_shape, dtype=np.float64, buffer=self.memory.buf, offset=self.series.nbytes)
+        if name is None:
+            # ticks a run did not reach
+            self.series[:] = np.nan
+            self.final[:] = np.nan
+
+    def close(self):
+        # the arrays must go before the buffer they view can be released
+        del self.series, self.final
+        self.memory.close()
+
+
+def start_series_worker(name, runs, ticks, metrics_directory, metrics_interval):
+    """ Pool initializer that attaches the worker to the parent's result block """
+    global block
+    block = ResultBlock(runs, ticks, name)
+    metrics.start_worker(metrics_directory, metrics_interval)
+
+
+def run_series(model, steps, label, parameters, series):
+    """
+    Steps a model like metrics.run_model, writing the reporters (egypt_model.REPORTERS) of every tick into series,
+    an array indexed [tick, reporter], e.g. a row of a shared or memory-mapped array
+    """
+    def record(model):
+        series[model.ticks] = egypt_model.compute_reporters(model)
+
+    metrics.run_model(model, steps, label, parameters, record)
+    # a model that stopped early has settled, its reporters keep their values until the final step
+    series[model.ticks + 1:steps + 1] = series[model.ticks]
+
+
+def simulate_series(item, headings, width, height):
+    """
+    Runs the simulation of an (index, run) item like simulate, but writes the reporters at every tick and at the final step
+    into row index of the result block instead of returning them
+    """
+    index, run = item
+    parameters = model_parameters(run, headings)
+    model = EgyptModel(w=width, h=height, **parameters)
+    num_steps = int(run[headings.index('[step]')])
+
+    run_series(model, num_steps, 'run-{}'.format(run[headings.index('[run number]')]), parameters, block.series[index])
+    block.final[index] = block.series[index, model.ticks]
+
+
+def simulate_queued(item):
+    """ Runs a simulation for a queue item, which carries everything needed to run it on any machine """
+    return simulate(item['run'], item['headings'], item['width'], item['height'])
+
+
+def series_results(runs, headings, final):
+    """ Returns the output rows of simulate from the final reporters in a result block """
+    step_index = headings.index('[step]')
+    results = []
+    for run, (python_gini, python_population, python_wealth) in zip(runs, final.tolist()):
+        results.append(run[:step_index + 1] + [python_gini, float(run[headings.index('gini-index-reserve / total-households / 0.5')]),
+                                               int(python_population), int(run[headings.index('total-population')]),
+                                               python_wealth, float(run[headings.index('total-grain')])])
+    return results
+
+
+def write_series(path, runs, headings, block):
+    """
+    Writes the result block as an uncompressed .npz file of arrays indexed by run: 'series' [run, tick, reporter],
+    'final' [run, reporter], and 'runs' the NetLogo run numbers, with the reporter names in 'reporters'.
+    Ticks after the final step of a run are NaN.
+    """
+    run_index = headings.index('[run number]')
+    np.savez(path, series=block.series, final=block.final, runs=np.array([run[run_index] for run in runs]),
+             reporters=np.array(egypt_model.REPORTER_NAMES))
+
+
+def write_output(path, headings, results):
+    """ Writes the parameters and results of each simulation to a csv file """
+    step_index = headings.index('[step]')
+
+    with open(path, 'w') as f:
+        f.write(', '.join(headings[:step_index + 1] + ['python-gini', 'netlogo-gini-index-reserve', 'python-total-population',
+                                                       'netlogo-total-population', 'python-total-wealth',
+                                                       'netlogo-total-wealth']) + '\n')
+
+        for result in results:
+            f.write(', '.join([str(x) for x in result]) + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Validates the Python model against NetLogo BehaviorSpace results.')
+    parser.add_argument('mode', nargs='?', default='local', choices=['local', 'enqueue', 'work', 'collect'],
+                        help='local: run all simulations on this machine (default), '
+                             'enqueue: add the simulations to the work queue, '
+                             'work: run queued simulations until all of them have completed, '
+                             'collect: write the results in the work queue to the output file')
+    parser.add_argument('--series', action='store_true',
+                        help='local mode: also record the reporters at every tick of every run in {}'.format(SERIES_FILE))
+    work_queue.add_arguments(parser, 'validation_output/queue')
+    args = parser.parse_args()
+
+    if args.mode == 'local' and args.series:
+        width, height, headings, runs = read_netlogo_table(NETLOGO_TABLE)
+        step_index = headings.index('[step]')
+
+        # the workers write their results straight into the block, nothing but the run rows is pickled
+        results_block = ResultBlock(len(runs), max(run[step_index] for run in runs))
+        try:
+            with metrics.MetricsWriter(counts=lambda: {'runs_total': len(runs)}, interval=args.metrics_interval):
+                with multiprocessing.Pool(args.processes, initializer=start_series_worker,
+                                          initargs=(results_block.memory.name, results_block.runs, results_block.ticks,
+                                                    metrics.METRICS_DIR, args.metrics_interval)) as p:
+                    p.map(partial(simulate_series, headings=headings, width=width, height=height), list(enumerate(runs)))
+
+            write_series(SERIES_FILE, runs, headings, results_block)
+            write_output(OUTPUT_FILE, headings, series_results(runs, headings, results_block.final))
+        finally:
+            results_block.close()
+            results_block.memory.unlink()
+
+    elif args.mode == 'local':
+        width, height, headings, runs = read_netlogo_table(NETLOGO_TABLE)
+
+        # use multiprocessing to speed up the process by running simulations in parallel.
+        with metrics.MetricsWriter(counts=lambda: {'runs_total': len(runs)}, interval=args.metrics_interval):
+            p = multiprocessing.Pool(args.processes, initializer=metrics.start_worker,
+                                     initargs=(metrics.METRICS_DIR, args.metrics_interval))
+            results = p.map(partial(simulate, headings=headings, width=width, height=height), runs)
+
+        # write the results to a file
+        write_output(OUTPUT_FILE, headings, results)
+
+    elif args.mode == 'enqueue':
+        width, height, headings, runs = read_netlogo_table(NETLOGO_TABLE)
+        queue = DirectoryQueue(args.queue)
+        run_index = headings.index('[run number]')
+        for run in runs:
+            queue.put('run-{:08d}'.format(run[run_index]), {'run': run, 'headings': headings, 'width': width, 'height': height})
+        print(queue.counts())
+
+    elif args.mode == 'work':
+        work_queue.run_workers(args.queue, simulate_queued, args.processes, args.lease_timeout, args.metrics_interval)
 
-f.close()
+    elif args.mode == 'collect':
+        headings = read_netlogo_table(NETLOGO_TABLE)[2]
+        write_output(OUTPUT_FILE, headings, work_queue.collect(args.queue))
@@ -0,0 +1,73 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+from functools import partial
+import numpy as np
+from egypt_model import EgyptModel
+import run_simulations
+
+HEADINGS = ['[run number]', 'starting-settlements', 'starting-households', 'starting-household-size', 'starting-grain',
+            'min-competency', 'min-ambition', 'pop-growth-rate', 'generational-variation', 'knowledge-radius',
+            'fallow-limit', 'distance-cost', 'land-rental-rate', 'allow-land-rental?', '[step]',
+            'gini-index-reserve / total-households / 0.5', 'total-population', 'total-grain']
+
+
+def netlogo_run(number, steps):
+    return [number, 14, 7, 5, 2000, 0.5, 0.1, 0.1, 0.9, 20, 4, 10, 50, 'true', steps,
+            0.5, 500, 100000.0]
+
+
+class TestSeries(unittest.TestCase):
+
+    def test_result_block(self):
+        # a run that reaches the last tick of the block and a shorter one
+        runs = [netlogo_run(1, 6), netlogo_run(2, 3)]
+        ticks = 6
+        block = run_simulations.ResultBlock(len(runs), ticks)
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                with multiprocessing.Pool(2, initializer=run_simulations.start_series_worker,
+                                          initargs=(block.memory.name, block.runs, block.ticks, directory, 10)) as p:
+                    p.map(partial(run_simulations.simulate_series, headings=HEADINGS, width=31, height=30), list(enumerate(runs)))
+
+                # the final reporters are those of the final step of each run
+                np.testing.assert_array_equal(block.final, block.series[[0, 1], [6, 3]])
+                self.assertFalse(np.isnan(block.series[0]).any())
+                # ticks after the final step of the shorter run are NaN
+                self.assertFalse(np.isnan(block.series[1, :4]).any())
+                self.assertTrue(np.isnan(block.series[1, 4:]).all())
+
+                path = os.path.join(directory, 'series.npz')
+                run_simulations.write_series(path, runs, HEADINGS, block)
+                with np.load(path) as arrays:
+                    self.assertEqual(sorted(arrays.files), ['final', 'reporters', 'runs', 'series'])
+                    self.assertEqual(arrays['series'].shape, (2, ticks + 1, 3))
+                    self.assertEqual(arrays['final'].shape, (2, 3))
+                    self.assertEqual(list(arrays['runs']), [1, 2])
+                    self.assertEqual(list(arrays['reporters']), ['gini', 'total-population', 'total-wealth'])
+                    np.testing.assert_array_equal(arrays['series'], block.series)
+                    np.testing.assert_array_equal(arrays['final'], block.final)
+
+                results = run_simulations.series_results(runs, HEADINGS, block.final)
+                self.assertEqual(results[1][:HEADINGS.index('[step]') + 1], runs[1][:HEADINGS.index('[step]') + 1])
+                self.assertEqual(results[1][HEADINGS.index('[step]') + 2::2], [0.5, 500, 100000.0])
+        finally:
+            block.close()
+            block.memory.unlink()
+
+    def test_early_stop(self):
+        # a model that dies off stops early, its settled reporters are repeated until the final step
+        model = EgyptModel(31, 30, starting_settlements=2, starting_households=2, starting_household_size=1, starting_grain=0,
+                           distance_cost=100, seed=1)
+        series = np.full((21, 3), np.nan)
+        run_simulations.run_series(model, 20, 'run-1', None, series)
+        self.assertFalse(model.running)
+        self.assertLess(model.ticks, 20)
+        self.assertFalse(np.isnan(series).any())
+        np.testing.assert_array_equal(series[model.ticks:], np.tile(series[model.ticks], (21 - model.ticks, 1)))
+        self.assertEqual(series[-1, 1], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
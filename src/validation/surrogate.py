@@ -0,0 +1,225 @@
+import argparse
+import json
+import numpy as np
+import pandas as pd
+from scipy.linalg import cho_factor, cho_solve
+from scipy.optimize import minimize
+from egypt_model import REPORTER_NAMES
+from sweep import OUTPUT_FILE, RESULT_COLUMNS, read_spec
+from simulations.headless_simulation import parse_value
+
+SURROGATE_FILE = 'validation_output/surrogate.npz'
+
+
+class GaussianProcess():
+    """Gaussian process regression with a squared exponential kernel that has one length scale per input.
+
+    Replicates of a parameter point are averaged before fitting, and the noise of each point mean is the replicate
+    noise divided by its number of replicates, which keeps the cost cubic in the number of points rather than runs.
+    The length scales, signal variance and replicate noise maximise the log marginal likelihood.
+    """
+
+    def __init__(self, X=None, counts=None, y=None, log_parameters=None, factor=None, alpha=None):
+        self.X = X
+        self.counts = counts
+        self.y = y
+        self.log_parameters = log_parameters
+        if factor is not None:
+            # a stored Cholesky factor, so that loading a fitted process costs nothing
+            self.factor = (factor, True)
+            self.alpha = alpha
+        elif X is not None:
+            self._factorise()
+
+    def _covariance(self, A, B, log_parameters):
+        length_scales = np.exp(log_parameters[:A.shape[1]])
+        signal_variance = np.exp(log_parameters[-2])
+        distances = (((A[:, None, :] - B[None, :, :]) / length_scales) ** 2).sum(axis=2)
+        return signal_variance * np.exp(-0.5 * distances)
+
+    def _noise(self, log_parameters):
+        return np.exp(log_parameters[-1]) / self.counts
+
+    def _negative_log_likelihood(self, log_parameters):
+        K = self._covariance(self.X, self.X, log_parameters) + np.diag(self._noise(log_parameters) + 1e-10)
+        try:
+            factor = cho_factor(K, lower=True)
+        except np.linalg.LinAlgError:
+            return np.inf
+        alpha = cho_solve(factor, self.y)
+        return 0.5 * self.y @ alpha + np.log(np.diag(factor[0])).sum()
+
+    def _factorise(self):
+        K = self._covariance(self.X, self.X, self.log_parameters) + np.diag(self._noise(self.log_parameters) + 1e-10)
+        self.factor = cho_factor(K, lower=True)
+        self.alpha = cho_solve(self.factor, self.y)
+
+    def fit(self, X, counts, y):
+        """ Fits the process to point means y at inputs X, scaled to [0, 1], each the mean of counts replicates """
+        self.X = X
+        self.counts = counts
+        self.y = y
+        # start from length scales of a quarter of the input range and noise of a tenth of the variance
+        start = np.concatenate([np.full(X.shape[1], np.log(0.25)), [np.log(max(y.var(), 1e-6))], [np.log(max(y.var(), 1e-6) / 10)]])
+        bounds = [(np.log(1e-2), np.log(1e2))] * X.shape[1] + [(np.log(1e-6), np.log(1e6))] * 2
+        result = minimize(self._negative_log_likelihood, start, method='L-BFGS-B', bounds=bounds)
+        self.log_parameters = result.x
+        self._factorise()
+        return self
+
+    def predict(self, X):
+        """ Returns the mean and standard deviation of the process at inputs X """
+        K_star = self._covariance(X, self.X, self.log_parameters)
+        mean = K_star @ self.alpha
+        variance = np.exp(self.log_parameters[-2]) - (K_star * cho_solve(self.factor, K_star.T).T).sum(axis=1)
+        return mean, np.sqrt(np.maximum(variance, 0))
+
+
+class Surrogate():
+    """Emulates the final reporters of EgyptModel from its parameters with one Gaussian process per reporter."""
+
+    def __init__(self, names, lower, upper, integer, boolean, y_mean, y_std, processes):
+        self.names = names  # the parameters that vary in the training data
+        self.lower = lower
+        self.upper = upper
+        self.integer = integer  # parameters that only took integer (or boolean) values
+        self.boolean = boolean  # parameters that were switches, suggested as True or False rather than 1 or 0
+        self.y_mean = y_mean
+        self.y_std = y_std
+        self.processes = processes
+        self.constants = {}  # parameters that had the same value in every run
+
+    @classmethod
+    def fit(cls, data):
+        """ Fits a surrogate to sweep results, a data frame as written by sweep.py """
+        columns = list(data.keys())
+        parameters = data[columns[columns.index('replicate') + 1:columns.index(RESULT_COLUMNS[0])]].astype(float)
+        names = [name for name in parameters if parameters[name].nunique() > 1]
+
+        groups = data.assign(**parameters).groupby(names)
+        means = groups[REPORTER_NAMES].mean()
+        counts = groups.size().values.astype(float)
+        X = means.index.to_frame().values.astype(float)
+
+        lower = X.min(axis=0)
+        upper = X.max(axis=0)
+        integer = np.array([bool(np.all(parameters[name] == np.round(parameters[name]))) for name in names])
+        boolean = np.array([data[name].dtype == bool for name in names])
+        y_mean = means.values.mean(axis=0)
+        y_std = np.maximum(means.values.std(axis=0), 1e-12)
+
+        Y = (means.values - y_mean) / y_std
+        scaled = (X - lower) / (upper - lower)
+        processes = [GaussianProcess().fit(scaled, counts, Y[:, i]) for i in range(len(REPORTER_NAMES))]
+
+        surrogate = cls(names, lower, upper, integer, boolean, y_mean, y_std, processes)
+        surrogate.constants = {name: data[name].iloc[0] for name in parameters if name not in names}
+        return surrogate
+
+    def predict(self, points):
+        """
+        Predicts the reporters at a list of parameter points (dicts of parameter values)
+        :return Returns arrays indexed [point, reporter] of the predicted mean and standard deviation
+        """
+        X = np.array([[float(point[name]) for name in self.names] for point in points])
+        scaled = (X - self.lower) / (self.upper - self.lower)
+        means = []
+        stds = []
+        for process in self.processes:
+            mean, std = process.predict(scaled)
+            means.append(mean)
+            stds.append(std)
+        return np.array(means).T * self.y_std + self.y_mean, np.array(stds).T * self.y_std
+
+    def suggest(self, count, candidates=2000, seed=None):
+        """
+        Suggests parameter points to simulate next: among random candidates within the parameter ranges, repeatedly picks
+        the one with the largest total standardised uncertainty, then treats it as observed so that the next pick lies elsewhere
+        """
+        rng = np.random.default_rng(seed)
+        scaled = rng.uniform(size=(candidates, len(self.names)))
+        # snap integer parameters to values that can actually be simulated
+        X = self.lower + scaled * (self.upper - self.lower)
+        X[:, self.integer] = np.round(X[:, self.integer])
+        scaled = (X - self.lower) / (self.upper - self.lower)
+
+        processes = list(self.processes)
+        suggestions = []
+        for i in range(count):
+            uncertainty = sum(process.predict(scaled)[1] ** 2 for process in processes)
+            best = int(np.argmax(uncertainty))
+            suggestions.append(X[best])
+            # the variance of a Gaussian process does not depend on the observed values, so the predicted mean will do
+            processes = [GaussianProcess(np.vstack([process.X, scaled[best]]), np.append(process.counts, 1),
+                                         np.append(process.y, process.predict(scaled[best:best + 1])[0]), process.log_parameters)
+                         for process in processes]
+
+        return [self.point(x) for x in suggestions]
+
+    def point(self, x):
+        """ Returns a parameter point dict for a row of parameter values, including the parameters that never changed """
+        point = {name: (bool(value) if boolean else int(value) if integer else float(value))
+                 for name, value, integer, boolean in zip(self.names, x, self.integer, self.boolean)}
+        point.update({name: value.item() if hasattr(value, 'item') else value for name, value in self.constants.items()})
+        return point
+
+    def save(self, path):
+        arrays = {'names': np.array(self.names), 'lower': self.lower, 'upper': self.upper, 'integer': self.integer, 'boolean': self.boolean,
+                  'y_mean': self.y_mean, 'y_std': self.y_std, 'constants': np.array(json.dumps(
+                      {name: value.item() if hasattr(value, 'item') else value for name, value in self.constants.items()}))}
+        for i, process in enumerate(self.processes):
+            arrays.update({'X{}'.format(i): process.X, 'counts{}'.format(i): process.counts, 'y{}'.format(i): process.y,
+                           'log_parameters{}'.format(i): process.log_parameters, 'factor{}'.format(i): process.factor[0],
+                           'alpha{}'.format(i): process.alpha})
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        arrays = np.load(path)
+        processes = [GaussianProcess(arrays['X{}'.format(i)], arrays['counts{}'.format(i)], arrays['y{}'.format(i)],
+                                     arrays['log_parameters{}'.format(i)], arrays['factor{}'.format(i)], arrays['alpha{}'.format(i)])
+                     for i in range(len(REPORTER_NAMES))]
+        surrogate = cls([str(name) for name in arrays['names']], arrays['lower'], arrays['upper'], arrays['integer'], arrays['boolean'],
+                        arrays['y_mean'], arrays['y_std'], processes)
+        surrogate.constants = json.loads(str(arrays['constants']))
+        return surrogate
+
+
+def read_sweep(path):
+    return pd.read_csv(path, delimiter=',', skipinitialspace=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Emulates the model with a surrogate fitted to sweep results.')
+    parser.add_argument('mode', choices=['fit', 'query', 'suggest'],
+                        help='fit: fit the surrogate to the sweep results, '
+                             'query: predict the reporters at a parameter point given as name=value pairs, '
+                             'suggest: write a sweep spec with the parameter points to simulate next')
+    parser.add_argument('values', nargs='*', help='parameter values to query, e.g. knowledge_radius=10 distance_cost=5')
+    parser.add_argument('--sweep', default=OUTPUT_FILE, help='sweep results to fit the surrogate to')
+    parser.add_argument('--count', type=int, default=10, help='number of parameter points to suggest')
+    parser.add_argument('--spec', help='sweep spec the results came from, its grid size, steps and replicates are used for the suggestions')
+    parser.add_argument('--output', default='validation_output/suggested_spec.json')
+    args = parser.parse_args()
+
+    if args.mode == 'fit':
+        Surrogate.fit(read_sweep(args.sweep)).save(SURROGATE_FILE)
+
+    elif args.mode == 'query':
+        surrogate = Surrogate.load(SURROGATE_FILE)
+        point = {name: parse_value(value) for name, value in (value.split('=', 1) for value in args.values)}
+        missing = [name for name in surrogate.names if name not in point]
+        if missing:
+            parser.error('missing values for ' + ', '.join(missing))
+        mean, std = surrogate.predict([point])
+        for i, name in enumerate(REPORTER_NAMES):
+            print('{}: {:.4f} +/- {:.4f}'.format(name, mean[0, i], std[0, i]))
+
+    elif args.mode == 'suggest':
+        if args.spec is None:
+            parser.error('--spec is required in suggest mode')
+        spec = read_spec(args.spec)
+        spec.pop('parameters', None)
+        spec['points'] = Surrogate.load(SURROGATE_FILE).suggest(args.count)
+        with open(args.output, 'w') as f:
+            json.dump(spec, f, indent=2)
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import surrogate
+
+
+class TestSurrogate(unittest.TestCase):
+
+    def setUp(self):
+        # two replicates of a grid over a switch and an integer parameter, with reporters that are smooth in both
+        rng = np.random.default_rng(1)
+        rows = []
+        for point, (allow_rental, knowledge_radius) in enumerate((a, k) for a in (False, True) for k in range(5, 45, 5)):
+            for replicate in range(2):
+                gini = 0.3 + 0.005 * knowledge_radius + 0.1 * allow_rental + rng.normal(0, 0.001)
+                rows.append([point, replicate, allow_rental, knowledge_radius, 500, 100,
+                             gini, 400 + 2 * knowledge_radius, 3000.0 * knowledge_radius + rng.normal(0, 10)])
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'sweep.csv')
+        with open(self.path, 'w') as f:
+            f.write('point, replicate, allow_rental, knowledge_radius, starting_grain, ticks, gini, total-population, total-wealth\n')
+            for row in rows:
+                f.write(', '.join(str(x) for x in row) + '\n')
+        self.data = surrogate.read_sweep(self.path)
+        self.surrogate = surrogate.Surrogate.fit(self.data)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_training_points(self):
+        self.assertEqual(self.surrogate.names, ['allow_rental', 'knowledge_radius'])
+        self.assertEqual(self.surrogate.constants, {'starting_grain': 500})
+
+        # at a training point the prediction is its mean over the replicates, with little uncertainty left
+        points = [{'allow_rental': False, 'knowledge_radius': 10}, {'allow_rental': True, 'knowledge_radius': 35}]
+        mean, std = self.surrogate.predict(points)
+        for point, predicted, deviation in zip(points, mean, std):
+            rows = self.data[(self.data['allow_rental'] == point['allow_rental']) &
+                             (self.data['knowledge_radius'] == point['knowledge_radius'])]
+            expected = rows[surrogate.REPORTER_NAMES].mean().values
+            np.testing.assert_allclose(predicted, expected, rtol=0.01)
+            self.assertTrue((deviation < 0.1 * self.surrogate.y_std).all())
+
+    def test_save_load(self):
+        path = os.path.join(self.directory.name, 'surrogate.npz')
+        self.surrogate.save(path)
+        loaded = surrogate.Surrogate.load(path)
+        points = [{'allow_rental': True, 'knowledge_radius': 12}, {'allow_rental': False, 'knowledge_radius': 27}]
+        for expected, actual in zip(self.surrogate.predict(points), loaded.predict(points)):
+            np.testing.assert_array_equal(actual, expected)
+        self.assertEqual(loaded.constants, self.surrogate.constants)
+        self.assertEqual(list(loaded.boolean), [True, False])
+
+    def test_suggest(self):
+        suggestions = self.surrogate.suggest(5, candidates=200, seed=1)
+        self.assertEqual(len(suggestions), 5)
+        for point in suggestions:
+            self.assertIsInstance(point['allow_rental'], bool)
+            self.assertIsInstance(point['knowledge_radius'], int)
+            self.assertTrue(5 <= point['knowledge_radius'] <= 40)
+            self.assertEqual(point['starting_grain'], 500)
+        # each suggestion is treated as observed, so the next one lies elsewhere
+        self.assertNotEqual(suggestions[0], suggestions[1])
+
+        # suggested switches can be written to the sweep results alongside earlier ones and fitted again
+        data = pd.concat([self.data, pd.DataFrame([dict(point, point=100 + i, replicate=0, ticks=100, gini=0.5,
+                                                        **{'total-population': 450, 'total-wealth': 60000.0})
+                                                   for i, point in enumerate(suggestions)])], ignore_index=True)
+        data.to_csv(self.path, index=False)
+        self.assertEqual(surrogate.Surrogate.fit(surrogate.read_sweep(self.path)).names, ['allow_rental', 'knowledge_radius'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,228 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from scipy import stats
+from egypt_model import EgyptModel
+import egypt_model
+import metrics
+import work_queue
+from work_queue import DirectoryQueue
+
+OUTPUT_FILE = 'validation_output/sweep.csv'
+SUMMARY_FILE = 'validation_output/adaptive_summary.csv'
+
+RESULT_COLUMNS = ['ticks'] + egypt_model.REPORTER_NAMES
+
+
+def read_spec(path):
+    """
+    Reads a sweep spec, a JSON file such as
+    {"width": 31, "height": 30, "steps": 500, "replicates": 5,
+     "parameters": {"knowledge_radius": [10, 20], "distance_cost": [5, 10, 15]}}
+    where each parameter is an EgyptModel keyword argument and the sweep covers every combination of their values.
+    Instead of "parameters" a spec can list the parameter points to run explicitly, e.g.
+    "points": [{"knowledge_radius": 12, "distance_cost": 7}, {"knowledge_radius": 18, "distance_cost": 4}]
+    An optional "seed" gives every replicate its own seed, shared by all parameter points (common random numbers), so that
+    differences between points are not drowned out by differences between replicates. "streams": true also gives each
+    stochastic process of the model its own random number stream (see egypt_model.random_streams) and "rng": "numpy"
+    draws the random numbers in bulk from NumPy generators instead of random.Random.
+    The adaptive mode runs replicates of each point until the confidence intervals of the mean of the reporters listed
+    in "widths" are narrower than the given widths, e.g.
+    "adaptive": {"min_replicates": 3, "max_replicates": 30, "confidence": 0.95,
+                 "widths": {"gini": 0.02, "total-population": 50, "total-wealth": 20000}}
+    """
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def replicate_seeds(seed, replicates):
+    """ Returns an independent seed for each replicate, derived from the seed of the sweep """
+    return [int(sequence.generate_state(1)[0]) for sequence in np.random.SeedSequence(seed).spawn(replicates)]
+
+
+def sweep_points(spec):
+    """ Returns a list of tasks, one for each replicate of each parameter point in the spec """
+    if 'points' in spec:
+        points = spec['points']
+    else:
+        names = sorted(spec['parameters'])
+        points = [dict(zip(names, values)) for values in itertools.product(*[spec['parameters'][name] for name in names])]
+
+    replicates = spec.get('replicates', 1)
+    seeds = replicate_seeds(spec['seed'], replicates) if 'seed' in spec else [None] * replicates
+
+    tasks = []
+    for point, parameters in enumerate(points):
+        for replicate in range(replicates):
+            tasks.append({
+                'point': point,
+                'replicate': replicate,
+                'width': spec['width'],
+                'height': spec['height'],
+                'steps': spec['steps'],
+                'seed': seeds[replicate],
+                'streams': spec.get('streams', False),
+                'rng': spec.get('rng', 'python'),
+                'parameters': parameters
+            })
+    return tasks
+
+
+def task_key(task):
+    return 'point-{:08d}-{:04d}'.format(task['point'], task['replicate'])
+
+
+def simulate(task):
+    """
+    Runs a simulation for one replicate of a parameter point
+    :return Returns the task with the final tick count and reporter values added
+    """
+    model = EgyptModel(task['width'], task['height'], seed=task.get('seed'), streams=task.get('streams', False),
+                       rng=task.get('rng', 'python'), **task['parameters'])
+
+    metrics.run_model(model, task['steps'], task_key(task), task['parameters'])
+
+    return dict(task, results=[model.ticks] + egypt_model.compute_reporters(model))
+
+
+def confidence_widths(values, confidence):
+    """ Returns the width of the t confidence interval of the mean of each column of values, indexed [replicate, reporter] """
+    n = len(values)
+    if n < 2:
+        return np.full(values.shape[1], np.inf)
+    return 2 * stats.t.ppf((1 + confidence) / 2, n - 1) * values.std(axis=0, ddof=1) / np.sqrt(n)
+
+
+def adaptive_sweep(spec, processes, initializer=None, initargs=(), function=simulate):
+    """
+    Runs replicates of every parameter point until the confidence intervals of its reporters are narrow enough or it
+    reaches max_replicates. Each free worker runs a replicate of the point whose intervals are furthest from their target
+    widths, allowing for the replicates of each point that are still running, so the noisiest points get the most runs.
+    :param function: runs a task and returns it with its results, simulate by default
+    :return Returns the results of every simulation and a summary row for each point
+    """
+    adaptive = spec['adaptive']
+    min_replicates = max(adaptive.get('min_replicates', 3), 2)
+    confidence = adaptive.get('confidence', 0.95)
+    names = list(adaptive['widths'])
+    columns = [RESULT_COLUMNS.index(name) for name in names]
+    targets = np.array([adaptive['widths'][name] for name in names])
+
+    # the tasks of every replicate a point may need, run in replicate order so that points share seeds
+    remaining = {}
+    for task in sweep_points(dict(spec, replicates=adaptive['max_replicates'])):
+        remaining.setdefault(task['point'], deque()).append(task)
+    values = {point: [] for point in remaining}
+    running_replicates = {point: 0 for point in remaining}
+
+    def excess(point):
+        """ How far the intervals of a point are expected to be from their targets once its running replicates finish """
+        n = len(values[point])
+        total = n + running_replicates[point]
+        if total < min_replicates:
+            return np.inf
+        if n < 2:
+            return None  # wait for results before running more
+        ratio = np.max(confidence_widths(np.array(values[point]), confidence) / targets)
+        return ratio * np.sqrt(n / total) if ratio > 1 else None
+
+    results = []
+    with ProcessPoolExecutor(processes, initializer=initializer, initargs=initargs) as executor:
+        running = {}
+        while True:
+            while len(running) < processes:
+                candidates = [(excess(point), point) for point in remaining if remaining[point]]
+                candidates = [(value, point) for value, point in candidates if value is not None]
+                if not candidates:
+                    break
+                point = max(candidates, key=lambda candidate: (candidate[0], -candidate[1]))[1]
+                running[executor.submit(function, remaining[point].popleft())] = point
+                running_replicates[point] += 1
+
+            if not running:
+                break
+            done, not_done = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                point = running.pop(future)
+                running_replicates[point] -= 1
+                result = future.result()
+                results.append(result)
+                values[point].append([result['results'][column] for column in columns])
+
+    summary = []
+    for point in sorted(values):
+        point_values = np.array(values[point])
+        widths = confidence_widths(point_values, confidence)
+        summary.append([point, len(point_values), bool(np.all(widths <= targets))] +
+                       [x for i in range(len(names)) for x in (point_values[:, i].mean(), widths[i])])
+    return results, summary
+
+
+def write_summary(path, names, summary):
+    """ Writes the number of replicates, whether the intervals converged and the mean and interval width of each point """
+    with open(path, 'w') as f:
+        f.write(', '.join(['point', 'replicates', 'converged'] + [x for name in names for x in (name, name + '-width')]) + '\n')
+        for row in summary:
+            f.write(', '.join([str(x) for x in row]) + '\n')
+
+
+def write_output(path, results):
+    """ Writes the parameters and results of each simulation to a csv file """
+    names = sorted(results[0]['parameters']) if results else []
+
+    with open(path, 'w') as f:
+        f.write(', '.join(['point', 'replicate'] + names + RESULT_COLUMNS) + '\n')
+
+        for result in sorted(results, key=lambda result: (result['point'], result['replicate'])):
+            row = [result['point'], result['replicate']] + [result['parameters'][name] for name in names] + result['results']
+            f.write(', '.join([str(x) for x in row]) + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the model for every combination of parameter values in a sweep spec.')
+    parser.add_argument('mode', choices=['local', 'adaptive', 'enqueue', 'work', 'collect'],
+                        help='local: run all simulations on this machine, '
+                             'adaptive: run replicates of each point on this machine until its confidence intervals are narrow enough, '
+                             'enqueue: add the simulations to the work queue, '
+                             'work: run queued simulations until all of them have completed, '
+                             'collect: write the results in the work queue to the output file')
+    parser.add_argument('--spec', help='sweep spec JSON file, required by local, adaptive and enqueue')
+    parser.add_argument('--output', default=OUTPUT_FILE)
+    work_queue.add_arguments(parser, 'validation_output/sweep_queue')
+    args = parser.parse_args()
+    worker_metrics = (metrics.METRICS_DIR, args.metrics_interval)
+
+    if args.mode in ('local', 'adaptive', 'enqueue') and args.spec is None:
+        parser.error('--spec is required in {} mode'.format(args.mode))
+
+    if args.mode == 'local':
+        tasks = sweep_points(read_spec(args.spec))
+        with metrics.MetricsWriter(counts=lambda: {'runs_total': len(tasks)}, interval=args.metrics_interval):
+            p = multiprocessing.Pool(args.processes, initializer=metrics.start_worker, initargs=worker_metrics)
+            write_output(args.output, p.map(simulate, tasks))
+
+    elif args.mode == 'adaptive':
+        spec = read_spec(args.spec)
+        if 'adaptive' not in spec:
+            parser.error('the spec has no "adaptive" settings')
+        with metrics.MetricsWriter(interval=args.metrics_interval):
+            results, summary = adaptive_sweep(spec, args.processes, metrics.start_worker, worker_metrics)
+        write_output(args.output, results)
+        write_summary(SUMMARY_FILE, list(spec['adaptive']['widths']), summary)
+        print('{} simulations, {} of {} points converged'.format(len(results), sum(row[2] for row in summary), len(summary)))
+
+    elif args.mode == 'enqueue':
+        queue = DirectoryQueue(args.queue)
+        for task in sweep_points(read_spec(args.spec)):
+            queue.put(task_key(task), task)
+        print(queue.counts())
+
+    elif args.mode == 'work':
+        work_queue.run_workers(args.queue, simulate, args.processes, args.lease_timeout, args.metrics_interval)
+
+    elif args.mode == 'collect':
+        write_output(args.output, work_queue.collect(args.queue))
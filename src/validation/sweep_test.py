@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+import sweep
+
+
+def stub_simulate(task):
+    """ Point 0 always gives the same results, the results of point 1 vary with the replicate's seed """
+    if task['parameters']['noisy']:
+        gini = np.random.default_rng(task['seed']).random()
+    else:
+        gini = 0.5
+    return dict(task, results=[task['steps'], gini, 100, 1000.0])
+
+
+class TestAdaptiveSweep(unittest.TestCase):
+
+    def test_confidence_widths(self):
+        self.assertTrue(np.isinf(sweep.confidence_widths(np.array([[1.0, 2.0]]), 0.95)).all())
+        np.testing.assert_allclose(sweep.confidence_widths(np.array([[1.0, 5.0], [1.0, 7.0]]), 0.95), [0, 2 * 12.7062], rtol=1e-4)
+
+    def test_stopping(self):
+        spec = {'width': 31, 'height': 30, 'steps': 10, 'seed': 1,
+                'points': [{'noisy': False}, {'noisy': True}],
+                'adaptive': {'min_replicates': 3, 'max_replicates': 8, 'widths': {'gini': 0.01}}}
+        results, summary = sweep.adaptive_sweep(spec, 2, function=stub_simulate)
+
+        # the constant point stops as soon as it can, the noisy point never gets narrow enough
+        self.assertEqual([row[:3] for row in summary], [[0, 3, True], [1, 8, False]])
+        self.assertEqual(summary[0][3:], [0.5, 0.0])
+
+        # each point runs its replicates in order, with the seeds every point shares
+        seeds = sweep.replicate_seeds(1, 8)
+        for point, replicates in ((0, 3), (1, 8)):
+            point_results = [result for result in results if result['point'] == point]
+            self.assertEqual(sorted(result['replicate'] for result in point_results), list(range(replicates)))
+            self.assertEqual([result['seed'] for result in sorted(point_results, key=lambda result: result['replicate'])],
+                             seeds[:replicates])
+
+
+if __name__ == '__main__':
+    unittest.main()
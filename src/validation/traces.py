@@ -0,0 +1,251 @@
+import argparse
+import gzip
+import itertools
+import json
+import multiprocessing
+import sys
+import zlib
+import numpy as np
+from scipy import stats
+from egypt_model import EgyptModel, STREAMS
+import egypt_model
+
+TRACE_FILE = 'validation_output/golden_trace.jsonl.gz'
+
+
+def read_scenario(path):
+    """
+    Reads a scenario, a JSON file such as
+    {"width": 31, "height": 30, "steps": 200, "seed": 1, "parameters": {"knowledge_radius": 10, "allow_rental": true}}
+    where the parameters are EgyptModel keyword arguments, including engine options such as "kernels" or "rng"
+    """
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class CountingRandom():
+    """Passes the draws of one of the model's random number streams through, counting them and checksumming their values."""
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.count = 0
+        self.checksum = 0
+
+    def record(self, value):
+        self.count += 1
+        self.checksum = zlib.crc32(repr(value).encode(), self.checksum)
+        return value
+
+    def random(self):
+        return self.record(self.generator.random())
+
+    def uniform(self, a, b):
+        return self.record(self.generator.uniform(a, b))
+
+    def randint(self, a, b):
+        return self.record(self.generator.randint(a, b))
+
+    def choice(self, seq):
+        return self.record(self.generator.choice(seq))
+
+    def __getattr__(self, name):
+        return getattr(self.generator, name)  # anything else is passed through without being counted
+
+
+class CountingBatchedRandom(CountingRandom):
+    """A CountingRandom for streams that also draw in bulk (rng='numpy'), counting each uniform of a bulk draw."""
+
+    def uniforms(self, n):
+        values = self.generator.uniforms(n)
+        self.count += n
+        self.checksum = zlib.crc32(values.tobytes(), self.checksum)
+        return values
+
+
+def instrument(model):
+    """ Wraps each random number stream of a model in a CountingRandom, once the model has been initialised """
+    counters = {name: (CountingBatchedRandom if hasattr(model.streams[name], 'uniforms') else CountingRandom)(model.streams[name])
+                for name in STREAMS}
+    model.streams.update(counters)
+    model.random = counters['init']
+    model.grid.random = counters['flood']
+    return counters
+
+
+def snapshot(model, households, counters):
+    """
+    Returns the trace of one tick: the number and checksum of the draws from each stream during the tick, and the
+    workers, grain and field positions of each living household, numbered in the order they were created
+    """
+    alive = set(id(household) for household in model.households)
+    trace = {
+        'tick': model.ticks,
+        'draws': {name: [counter.count, counter.checksum] for name, counter in counters.items()},
+        'households': [[number, household.workers, float(household.grain), sorted(list(field.pos) for field in household.fields)]
+                       for number, household in households if id(household) in alive]
+    }
+    for counter in counters.values():
+        counter.count = 0
+        counter.checksum = 0
+    return trace
+
+
+def run_trace(scenario, **options):
+    """
+    Runs a scenario, with options overriding its parameters, and yields its trace one tick at a time, starting with the
+    state after initialisation (draws made during initialisation are not counted)
+    """
+    parameters = dict(scenario.get('parameters', {}), **options)
+    model = EgyptModel(scenario['width'], scenario['height'], seed=scenario['seed'], **parameters)
+    counters = instrument(model)
+    households = list(enumerate(model.households))  # households are only ever created during initialisation
+
+    yield snapshot(model, households, counters)
+    while model.running and model.ticks < scenario['steps']:
+        model.step()
+        yield snapshot(model, households, counters)
+
+
+def record(scenario, path):
+    """ Writes the trace of a scenario to a gzipped JSON lines file, headed by the scenario """
+    with gzip.open(path, 'wt') as f:
+        f.write(json.dumps({'scenario': scenario}) + '\n')
+        for tick in run_trace(scenario):
+            f.write(json.dumps(tick) + '\n')
+
+
+def read_trace(path):
+    """ Returns the scenario of a recorded trace and a generator of its ticks """
+    f = gzip.open(path, 'rt')
+    scenario = json.loads(f.readline())['scenario']
+
+    def ticks():
+        with f:
+            for line in f:
+                yield json.loads(line)
+
+    return scenario, ticks()
+
+
+def difference(golden, trace, tolerance=0.0):
+    """ Returns a description of the first difference between the traces of one tick, or None if they agree """
+    golden_households = {household[0]: household for household in golden['households']}
+    households = {household[0]: household for household in trace['households']}
+
+    for number in sorted(set(golden_households) | set(households)):
+        if number not in households:
+            return 'household {} died'.format(number)
+        if number not in golden_households:
+            return 'household {} is still alive'.format(number)
+        expected = golden_households[number]
+        actual = households[number]
+        if expected[1] != actual[1]:
+            return 'household {} has {} workers instead of {}'.format(number, actual[1], expected[1])
+        if abs(expected[2] - actual[2]) > tolerance * max(abs(expected[2]), 1):
+            return 'household {} has {!r} grain instead of {!r}'.format(number, actual[2], expected[2])
+        if expected[3] != actual[3]:
+            missing = [pos for pos in expected[3] if pos not in actual[3]]
+            extra = [pos for pos in actual[3] if pos not in expected[3]]
+            return 'household {} lacks fields {} and has fields {} instead'.format(number, missing, extra)
+
+    for name in STREAMS:
+        if golden['draws'][name] != trace['draws'][name]:
+            return 'the {} stream made {} draws (checksum {}) instead of {} (checksum {})'.format(
+                name, trace['draws'][name][0], trace['draws'][name][1], golden['draws'][name][0], golden['draws'][name][1])
+
+    return None
+
+
+def compare(path, tolerance=0.0, **options):
+    """
+    Replays a recorded scenario with options for an alternative implementation, e.g. kernels='numpy'
+    :return Returns the first tick at which the traces diverge and a description of the difference, or None if they agree
+    """
+    scenario, golden_ticks = read_trace(path)
+    previous = 0
+    for golden, trace in itertools.zip_longest(golden_ticks, run_trace(scenario, **options)):
+        if trace is None:
+            return golden['tick'], 'the model stopped after tick {}'.format(previous)
+        if golden is None:
+            return trace['tick'], 'the model kept running after tick {}'.format(previous)
+        description = difference(golden, trace, tolerance)
+        if description is not None:
+            return trace['tick'], description
+        previous = trace['tick']
+    return None
+
+
+def final_reporters(args):
+    """ Runs a scenario with a seed and options and returns the final value of each reporter """
+    scenario, seed, options = args
+    model = EgyptModel(scenario['width'], scenario['height'], seed=seed, **dict(scenario.get('parameters', {}), **options))
+    while model.running and model.ticks < scenario['steps']:
+        model.step()
+    return egypt_model.compute_reporters(model)
+
+
+def statistical_comparison(scenario, seeds, options, alpha=0.05, processes=None):
+    """
+    Compares the final reporters of the scenario and of an alternative implementation over many seeds, for alternatives
+    that draw random numbers in a different order and so can not be compared tick by tick
+    :return Returns, for each reporter, the means of both implementations and the p-values of Welch's t-test and the
+    Kolmogorov-Smirnov test, and whether neither test rejects equivalence at level alpha
+    """
+    seed_list = list(range(scenario['seed'], scenario['seed'] + seeds))
+    with multiprocessing.Pool(processes) as p:
+        reference = np.array(p.map(final_reporters, [(scenario, seed, {}) for seed in seed_list]))
+        alternative = np.array(p.map(final_reporters, [(scenario, seed, options) for seed in seed_list]))
+
+    results = []
+    for i, (name, reporter) in enumerate(egypt_model.REPORTERS):
+        t_p = stats.ttest_ind(reference[:, i], alternative[:, i], equal_var=False).pvalue
+        ks_p = stats.ks_2samp(reference[:, i], alternative[:, i]).pvalue
+        # identical samples give a NaN t-test p-value
+        t_p = 1.0 if np.isnan(t_p) else t_p
+        results.append((name, reference[:, i].mean(), alternative[:, i].mean(), t_p, ks_p, t_p >= alpha and ks_p >= alpha))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Records golden traces of the model and checks alternative implementations against them.')
+    parser.add_argument('mode', choices=['record', 'compare', 'statistical'],
+                        help='record: write the trace of a scenario, '
+                             'compare: replay a recorded trace with the alternative options and report the first divergence, '
+                             'statistical: compare the final reporters of the scenario and the alternative over many seeds')
+    parser.add_argument('--scenario', help='scenario JSON file, required by record and statistical')
+    parser.add_argument('--trace', default=TRACE_FILE)
+    parser.add_argument('--kernels', help='kernels of the alternative implementation')
+    parser.add_argument('--rng', help='random number generator of the alternative implementation')
+    parser.add_argument('--streams', action='store_true', help='the alternative draws from a stream per process')
+    parser.add_argument('--tolerance', type=float, default=0.0, help='relative tolerance for grain (compare)')
+    parser.add_argument('--seeds', type=int, default=30, help='number of seeds (statistical)')
+    parser.add_argument('--alpha', type=float, default=0.05, help='significance level (statistical)')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes on this machine (statistical)')
+    args = parser.parse_args()
+
+    options = {name: getattr(args, name) for name in ('kernels', 'rng') if getattr(args, name) is not None}
+    if args.streams:
+        options['streams'] = True
+
+    if args.mode in ('record', 'statistical') and args.scenario is None:
+        parser.error('--scenario is required in {} mode'.format(args.mode))
+
+    if args.mode == 'record':
+        record(read_scenario(args.scenario), args.trace)
+
+    elif args.mode == 'compare':
+        divergence = compare(args.trace, args.tolerance, **options)
+        if divergence is None:
+            print('The traces agree')
+        else:
+            print('The traces diverge at tick {}: {}'.format(*divergence))
+            sys.exit(1)
+
+    elif args.mode == 'statistical':
+        results = statistical_comparison(read_scenario(args.scenario), args.seeds, options, args.alpha, args.processes)
+        for name, reference_mean, alternative_mean, t_p, ks_p, equivalent in results:
+            print('{}: mean {:.4f} vs {:.4f}, Welch p = {:.3f}, KS p = {:.3f}, {}'.format(
+                name, reference_mean, alternative_mean, t_p, ks_p, 'no difference detected' if equivalent else 'DIFFERENT'))
+        if not all(result[-1] for result in results):
+            sys.exit(1)
@@ -0,0 +1,77 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from egypt_model import EgyptModel
+import traces
+
+SCENARIO = {'width': 31, 'height': 30, 'steps': 8, 'seed': 1, 'parameters': {'knowledge_radius': 10, 'allow_rental': True}}
+
+
+class TestTraces(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'trace.jsonl.gz')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_numpy_kernels_agree(self):
+        traces.record(SCENARIO, self.path)
+        self.assertIsNone(traces.compare(self.path, kernels='numpy'))
+
+    def test_perturbed_run(self):
+        # nudge the grain of one household at tick 5 of the golden trace, the replay should diverge exactly there
+        traces.record(SCENARIO, self.path)
+        with gzip.open(self.path, 'rt') as f:
+            lines = [json.loads(line) for line in f]
+        household = lines[1 + 5]['households'][3]
+        household[2] += 1.0
+        with gzip.open(self.path, 'wt') as f:
+            for line in lines:
+                f.write(json.dumps(line) + '\n')
+
+        tick, description = traces.compare(self.path)
+        self.assertEqual(tick, 5)
+        self.assertTrue(description.startswith('household {} has'.format(household[0])), description)
+        # a tolerance that covers the nudge lets it through
+        self.assertIsNone(traces.compare(self.path, tolerance=1.0))
+
+    def test_difference_tolerance(self):
+        draws = {name: [1, 2] for name in traces.STREAMS}
+        golden = {'tick': 1, 'draws': draws, 'households': [[0, 3, 100.0, [[1, 2]]]]}
+        trace = {'tick': 1, 'draws': draws, 'households': [[0, 3, 100.5, [[1, 2]]]]}
+        self.assertIsNone(traces.difference(golden, golden))
+        self.assertEqual(traces.difference(golden, trace), 'household 0 has 100.5 grain instead of 100.0')
+        self.assertIsNone(traces.difference(golden, trace, tolerance=0.005))
+        self.assertIsNotNone(traces.difference(golden, trace, tolerance=0.004))
+        # small grain is compared absolutely rather than relative to itself
+        golden['households'][0][2] = 0.0
+        trace['households'][0][2] = 0.5
+        self.assertIsNone(traces.difference(golden, trace, tolerance=0.5))
+
+        # the draws are compared once the households agree
+        trace = dict(golden, draws=dict(draws, claim=[2, 3]))
+        self.assertEqual(traces.difference(golden, trace),
+                         'the claim stream made 2 draws (checksum 3) instead of 1 (checksum 2)')
+
+    def test_traced_run_is_the_run(self):
+        # counting the draws must not change the run, including the bulk draws of rng='numpy'
+        for rng in ('python', 'numpy'):
+            model = EgyptModel(SCENARIO['width'], SCENARIO['height'], seed=SCENARIO['seed'], rng=rng, **SCENARIO['parameters'])
+            households = list(enumerate(model.households))
+            while model.running and model.ticks < SCENARIO['steps']:
+                model.step()
+            alive = set(id(household) for household in model.households)
+            expected = [[number, household.workers, float(household.grain)] for number, household in households
+                        if id(household) in alive]
+
+            *rest, last = traces.run_trace(SCENARIO, rng=rng)
+            self.assertEqual([household[:3] for household in last['households']], expected)
+            self.assertGreater(last['draws']['claim'][0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
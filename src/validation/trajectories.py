@@ -0,0 +1,155 @@
+import argparse
+import csv
+import multiprocessing
+import os
+import warnings
+import numpy as np
+from egypt_model import EgyptModel
+import egypt_model
+import metrics
+from run_simulations import NETLOGO_TABLE, read_netlogo_table, model_parameters, run_series
+
+TRAJECTORY_DIR = 'validation_output/trajectories'
+ERRORS_FILE = 'validation_output/trajectory_errors.csv'
+
+# the NetLogo column of each reporter compared at every tick (egypt_model.REPORTERS)
+NETLOGO_COLUMNS = {
+    'gini': 'gini-index-reserve / total-households / 0.5',
+    'total-population': 'total-population',
+    'total-wealth': 'total-grain'
+}
+
+# NetLogo values below which the relative error of a reporter is not meaningful, e.g. after a die-off
+FLOORS = [0.01, 1, 1]
+
+
+def read_netlogo_trajectories(path, directory):
+    """
+    Streams every row of a NetLogo BehaviorSpace table into a memory-mapped array indexed [run, step, metric],
+    saved as netlogo.npy in directory together with the run numbers (runs.npy). Steps a run did not reach are NaN.
+    :return Returns the memory-mapped array
+    """
+    def rows():
+        with open(path, 'r') as file:
+            reader = csv.reader(file, skipinitialspace=True)
+            headings = [next(reader) for i in range(7)][6]
+            run_index = headings.index('[run number]')
+            step_index = headings.index('[step]')
+            metric_indices = [headings.index(NETLOGO_COLUMNS[name]) for name in egypt_model.REPORTER_NAMES]
+            for row in reader:
+                yield int(row[run_index]), int(row[step_index]), [float(row[i]) for i in metric_indices]
+
+    # first pass: find the runs and the number of steps, so that the array can be allocated on disk
+    run_numbers = set()
+    max_step = 0
+    for run, step, values in rows():
+        run_numbers.add(run)
+        max_step = max(max_step, step)
+    run_numbers = np.array(sorted(run_numbers))
+
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, 'runs.npy'), run_numbers)
+    trajectories = np.lib.format.open_memmap(os.path.join(directory, 'netlogo.npy'), mode='w+', dtype=np.float64,
+                                             shape=(len(run_numbers), max_step + 1, len(egypt_model.REPORTERS)))
+    trajectories[:] = np.nan
+
+    # second pass: fill in the reporter values
+    for run, step, values in rows():
+        trajectories[np.searchsorted(run_numbers, run), step] = values
+
+    trajectories.flush()
+    return trajectories
+
+
+def simulate_trajectory(args):
+    """
+    Runs the simulation for one NetLogo run and writes the reporter values of every tick straight into its row of the
+    memory-mapped python.npy array, so that trajectories do not have to be sent back to the parent process
+    """
+    index, run, headings, width, height, path = args
+    parameters = model_parameters(run, headings)
+    model = EgyptModel(w=width, h=height, **parameters)
+    num_steps = int(run[headings.index('[step]')])
+
+    trajectories = np.load(path, mmap_mode='r+')
+    run_series(model, num_steps, 'run-{}'.format(run[headings.index('[run number]')]), parameters, trajectories[index])
+    trajectories.flush()
+
+
+def compare_trajectories(python, netlogo, tolerance, chunk_size=1024, floors=FLOORS):
+    """
+    Computes error metrics between the Python and NetLogo trajectories of each run, a chunk of runs at a time.
+    Steps at which the NetLogo value of a metric is below its floor are left out of the relative errors, but a run
+    diverges at such a step if the Python value differs from it by more than the floor.
+    :return Returns arrays indexed [run, metric] of the mean and maximum absolute relative error over all steps
+    and the first step at which the run diverges (-1 if it never does)
+    """
+    floors = np.asarray(floors, dtype=np.float64)
+    runs = python.shape[0]
+    mean_error = np.empty((runs, len(egypt_model.REPORTERS)))
+    max_error = np.empty((runs, len(egypt_model.REPORTERS)))
+    first_divergence = np.empty((runs, len(egypt_model.REPORTERS)), dtype=np.int64)
+
+    for start in range(0, runs, chunk_size):
+        O = np.asarray(python[start:start + chunk_size])
+        E = np.asarray(netlogo[start:start + chunk_size])
+        # relative error as in regression.compare, where NetLogo's value is large enough to divide by
+        small = np.abs(E) < floors
+        difference = np.abs(O - E)
+        error = np.where(small, np.nan, difference / np.where(small, 1, np.abs(E)))
+        error[np.isnan(E)] = np.nan  # steps NetLogo did not record
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # runs without any step to compare
+            mean_error[start:start + chunk_size] = np.nanmean(error, axis=1)
+            max_error[start:start + chunk_size] = np.nanmax(error, axis=1)
+        diverged = (np.nan_to_num(error, nan=0) > tolerance) | (small & (difference > floors))
+        first_divergence[start:start + chunk_size] = np.where(diverged.any(axis=1), diverged.argmax(axis=1), -1)
+
+    return mean_error, max_error, first_divergence
+
+
+def write_errors(path, run_numbers, mean_error, max_error, first_divergence):
+    """ Writes the error metrics of each run to a csv file """
+    with open(path, 'w') as f:
+        columns = ['[run number]']
+        for name in egypt_model.REPORTER_NAMES:
+            columns += ['mean-error-' + name, 'max-error-' + name, 'first-divergence-' + name]
+        f.write(', '.join(columns) + '\n')
+
+        for i, run in enumerate(run_numbers):
+            row = [run]
+            for j in range(len(egypt_model.REPORTERS)):
+                row += [mean_error[i, j], max_error[i, j], first_divergence[i, j]]
+            f.write(', '.join([str(x) for x in row]) + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares the Python and NetLogo trajectories of every run tick by tick.')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='relative error above which a run counts as diverged (default: 0.1)')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes on this machine')
+    parser.add_argument('--metrics-interval', type=float, default=10,
+                        help='seconds between updates of the live metrics in validation_output/metrics.json')
+    args = parser.parse_args()
+
+    netlogo = read_netlogo_trajectories(NETLOGO_TABLE, TRAJECTORY_DIR)
+    run_numbers = np.load(os.path.join(TRAJECTORY_DIR, 'runs.npy'))
+
+    width, height, headings, runs = read_netlogo_table(NETLOGO_TABLE)
+    python_path = os.path.join(TRAJECTORY_DIR, 'python.npy')
+    python = np.lib.format.open_memmap(python_path, mode='w+', dtype=np.float64, shape=netlogo.shape)
+    python[:] = np.nan
+    python.flush()
+
+    with metrics.MetricsWriter(counts=lambda: {'runs_total': len(runs)}, interval=args.metrics_interval):
+        p = multiprocessing.Pool(args.processes, initializer=metrics.start_worker, initargs=(metrics.METRICS_DIR, args.metrics_interval))
+        p.map(simulate_trajectory, [(i, run, headings, width, height, python_path) for i, run in enumerate(runs)])
+
+    mean_error, max_error, first_divergence = compare_trajectories(python, netlogo, args.tolerance)
+    write_errors(ERRORS_FILE, run_numbers, mean_error, max_error, first_divergence)
+
+    for j, name in enumerate(egypt_model.REPORTER_NAMES):
+        diverged = first_divergence[:, j] >= 0
+        print('{}: mean relative error {:.4f}, {} of {} runs diverge'.format(
+            name, np.nanmean(mean_error[:, j]), diverged.sum(), len(run_numbers)))
@@ -0,0 +1,25 @@
+import unittest
+import numpy as np
+import trajectories
+
+
+class TestCompareTrajectories(unittest.TestCase):
+
+    def test_netlogo_zero(self):
+        # NetLogo's population and wealth die off while Python's do not: the run diverges there, but the step is left
+        # out of the relative errors instead of dividing by zero
+        netlogo = np.array([[[0.5, 100, 1000], [0.0, 0, 0], [0.4, 50, 500], [np.nan, np.nan, np.nan]]])
+        python = np.array([[[0.5, 100, 1000], [0.3, 20, 10], [0.4, 55, 500], [0.4, 55, 500]]])
+        mean_error, max_error, first_divergence = trajectories.compare_trajectories(python, netlogo, 0.2, chunk_size=1)
+        np.testing.assert_allclose(mean_error, [[0, 0.05, 0]])
+        np.testing.assert_allclose(max_error, [[0, 0.1, 0]])
+        np.testing.assert_array_equal(first_divergence, [[1, 1, 1]])
+
+        # both at zero agree
+        mean_error, max_error, first_divergence = trajectories.compare_trajectories(netlogo, netlogo, 0.2)
+        np.testing.assert_array_equal(mean_error, [[0, 0, 0]])
+        np.testing.assert_array_equal(first_divergence, [[-1, -1, -1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import json
+import multiprocessing
+import os
+import socket
+import time
+import metrics
+
+# states an item moves through, each one a subdirectory of the queue directory
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+
+
+class DirectoryQueue():
+    """A durable work queue kept as one JSON file per item in a directory.
+
+    The directory can live on a filesystem shared between machines (e.g. an NFS mount), so that any number of
+    worker processes on any number of hosts can pull from the same queue. Items are claimed by renaming them from
+    pending/ to leased/, which only one worker can succeed at. Claimed items whose lease has not been completed within
+    lease_timeout seconds (e.g. because the worker crashed) are put back into pending/. Results are written once
+    to done/ and never overwritten, so an item that ends up being run twice still produces a single result.
+    """
+
+    def __init__(self, path, lease_timeout=24 * 60 * 60):
+        self.path = path
+        self.lease_timeout = lease_timeout
+        for state in (PENDING, LEASED, DONE):
+            os.makedirs(os.path.join(self.path, state), exist_ok=True)
+
+    def _file(self, state, key):
+        return os.path.join(self.path, state, key + '.json')
+
+    def _keys(self, state):
+        return sorted(name[:-len('.json')] for name in os.listdir(os.path.join(self.path, state))
+                      if name.endswith('.json') and not name.startswith('.'))
+
+    def _write(self, state, key, data):
+        """ Writes a file atomically so that readers never see a partially written item """
+        temp_file = os.path.join(self.path, state, '.{}.{}-{}.tmp'.format(key, socket.gethostname(), os.getpid()))
+        with open(temp_file, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_file, self._file(state, key))
+
+    def _read(self, state, key):
+        with open(self._file(state, key), 'r') as f:
+            return json.load(f)
+
+    def put(self, key, item):
+        """ Adds an item to the queue unless an item with the same key has already been added """
+        if not any(os.path.exists(self._file(state, key)) for state in (PENDING, LEASED, DONE)):
+            self._write(PENDING, key, item)
+
+    def claim(self):
+        """ Leases the next pending item, returns a (key, item) tuple or None if there is nothing left to claim """
+        for key in self._keys(PENDING):
+            try:
+                # the lease starts now: touch the file before it appears in leased/, or another worker could see the
+                # enqueue time as an expired lease and put it straight back
+                os.utime(self._file(PENDING, key))
+                os.rename(self._file(PENDING, key), self._file(LEASED, key))
+            except FileNotFoundError:
+                continue  # another worker claimed it first
+            try:
+                if os.path.exists(self._file(DONE, key)):
+                    os.remove(self._file(LEASED, key))
+                    continue
+                return key, self._read(LEASED, key)
+            except FileNotFoundError:
+                continue  # the lease was lost to requeue_expired and the item claimed elsewhere
+        return None
+
+    def complete(self, key, result):
+        """ Stores the result of a leased item and releases the lease """
+        if not os.path.exists(self._file(DONE, key)):
+            self._write(DONE, key, result)
+        try:
+            os.remove(self._file(LEASED, key))
+        except FileNotFoundError:
+            pass  # the lease expired and the item was run again elsewhere
+
+    def requeue_expired(self):
+        """ Puts items back into the queue whose lease has run out """
+        now = time.time()
+        for key in self._keys(LEASED):
+            try:
+                if now - os.path.getmtime(self._file(LEASED, key)) > self.lease_timeout:
+                    os.rename(self._file(LEASED, key), self._file(PENDING, key))
+            except FileNotFoundError:
+                pass  # completed in the meantime
+
+    def counts(self):
+        """ Returns the number of pending, leased and done items """
+        return {state: len(self._keys(state)) for state in (PENDING, LEASED, DONE)}
+
+    def results(self):
+        """ Returns a list of (key, result) tuples for all completed items, ordered by key """
+        return [(key, self._read(DONE, key)) for key in self._keys(DONE)]
+
+
+def work(queue, function, initializer=None, initargs=(), poll_interval=60):
+    """
+    Runs function on items pulled from the queue, after calling initializer(*initargs) as a multiprocessing.Pool would.
+    Once no items are pending the worker keeps polling every poll_interval seconds while other workers still hold leases,
+    so that the items of a worker that died are run once their lease expires.
+    :return Returns the number of items completed by this worker
+    """
+    if initializer is not None:
+        initializer(*initargs)
+    completed = 0
+    while True:
+        queue.requeue_expired()
+        claimed = queue.claim()
+        if claimed is None:
+            if not queue.counts()[LEASED]:
+                return completed
+            time.sleep(poll_interval)
+            continue
+        key, item = claimed
+        queue.complete(key, function(item))
+        completed += 1
+
+
+def add_arguments(parser, queue):
+    """ Adds the work queue options shared by the runners to an argparse parser, with queue as the default directory """
+    parser.add_argument('--queue', default=queue,
+                        help='work queue directory, e.g. on a filesystem shared by all worker machines')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes on this machine')
+    parser.add_argument('--lease-timeout', type=float, default=24 * 60 * 60,
+                        help='seconds after which a simulation leased by a worker that has not finished it is handed out again')
+    parser.add_argument('--metrics-interval', type=float, default=10,
+                        help='seconds between updates of the live metrics in validation_output/metrics.json '
+                             '(or metrics.json in the queue directory)')
+
+
+def run_workers(path, function, processes, lease_timeout, metrics_interval):
+    """
+    Runs work() in processes worker processes on this machine until every item of the queue in path has completed.
+    The workers of every machine report their metrics to the queue directory, which this machine summarises in its metrics.json.
+    """
+    queue_metrics = (os.path.join(path, 'metrics'), metrics_interval)
+    workers = [multiprocessing.Process(target=work, args=(DirectoryQueue(path, lease_timeout), function, metrics.start_worker, queue_metrics))
+               for i in range(processes)]
+    with metrics.MetricsWriter(os.path.join(path, 'metrics.json'), queue_metrics[0], metrics.queue_counts(DirectoryQueue(path)),
+                               metrics_interval, clear=False):
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+
+def collect(path):
+    """ Returns the results in the queue in path in key order, after warning about items that have not completed yet """
+    queue = DirectoryQueue(path)
+    counts = queue.counts()
+    if counts[PENDING] or counts[LEASED]:
+        print('Warning: {} simulations have not completed yet'.format(counts[PENDING] + counts[LEASED]))
+    return [result for key, result in queue.results()]
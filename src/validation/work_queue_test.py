@@ -0,0 +1,108 @@
+import io
+import os
+import tempfile
+from contextlib import redirect_stdout
+import time
+import unittest
+import work_queue
+from work_queue import DirectoryQueue
+
+
+def double(item):
+    return item['value'] * 2
+
+
+class TestDirectoryQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.queue = DirectoryQueue(self.directory.name, lease_timeout=60)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_put_claim_complete(self):
+        self.queue.put('b', {'value': 2})
+        self.queue.put('a', {'value': 1})
+        self.queue.put('a', {'value': 3})  # already queued
+        self.assertEqual(self.queue.counts(), {'pending': 2, 'leased': 0, 'done': 0})
+
+        self.assertEqual(self.queue.claim(), ('a', {'value': 1}))
+        self.assertEqual(self.queue.counts(), {'pending': 1, 'leased': 1, 'done': 0})
+        self.queue.complete('a', 10)
+        self.assertEqual(self.queue.claim(), ('b', {'value': 2}))
+        self.queue.complete('b', 20)
+        self.assertIsNone(self.queue.claim())
+        self.assertEqual(self.queue.counts(), {'pending': 0, 'leased': 0, 'done': 2})
+        self.assertEqual(self.queue.results(), [('a', 10), ('b', 20)])
+
+        self.queue.put('a', {'value': 1})  # already done
+        self.assertIsNone(self.queue.claim())
+
+    def test_claim_starts_lease(self):
+        # an item enqueued long ago is not mistaken for an expired lease once claimed
+        self.queue.put('a', {})
+        path = os.path.join(self.directory.name, work_queue.PENDING, 'a.json')
+        os.utime(path, (time.time() - 3600, time.time() - 3600))
+        self.queue.claim()
+        self.queue.requeue_expired()
+        self.assertEqual(self.queue.counts(), {'pending': 0, 'leased': 1, 'done': 0})
+
+    def test_requeue_expired(self):
+        self.queue.put('a', {'value': 1})
+        self.queue.claim()
+        path = os.path.join(self.directory.name, work_queue.LEASED, 'a.json')
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        self.queue.requeue_expired()
+        self.assertEqual(self.queue.counts(), {'pending': 1, 'leased': 0, 'done': 0})
+        self.assertEqual(self.queue.claim(), ('a', {'value': 1}))
+
+    def test_idempotent_results(self):
+        # an item whose lease expired is run twice, the first result is kept
+        self.queue.put('a', {})
+        self.queue.claim()
+        os.utime(os.path.join(self.directory.name, work_queue.LEASED, 'a.json'), (0, 0))
+        self.queue.requeue_expired()
+        self.queue.claim()
+        self.queue.complete('a', 1)
+        self.queue.complete('a', 2)  # the first worker finishes after all
+        self.assertEqual(self.queue.results(), [('a', 1)])
+        self.assertEqual(self.queue.counts(), {'pending': 0, 'leased': 0, 'done': 1})
+
+        # a requeued item that has been completed in the meantime is dropped when claimed
+        self.queue.put('b', {})
+        self.queue.claim()
+        self.queue.complete('b', 3)
+        self.queue._write(work_queue.PENDING, 'b', {})
+        self.assertIsNone(self.queue.claim())
+        self.assertEqual(self.queue.results(), [('a', 1), ('b', 3)])
+
+    def test_work(self):
+        for i in range(3):
+            self.queue.put('item-{}'.format(i), {'value': i})
+        self.assertEqual(work_queue.work(self.queue, lambda item: item['value'] * 2), 3)
+        self.assertEqual(self.queue.results(), [('item-0', 0), ('item-1', 2), ('item-2', 4)])
+
+    def test_work_waits_for_leases(self):
+        # the lease of a worker that died runs out and the item is run by a worker still polling
+        self.queue.lease_timeout = 0.2
+        self.queue.put('a', {'value': 1})
+        self.queue.claim()
+        self.assertEqual(work_queue.work(self.queue, lambda item: item['value'], poll_interval=0.05), 1)
+        self.assertEqual(self.queue.results(), [('a', 1)])
+
+    def test_run_workers_and_collect(self):
+        for i in range(3):
+            self.queue.put('item-{}'.format(i), {'value': i})
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(work_queue.collect(self.directory.name), [])
+        self.assertEqual(output.getvalue(), 'Warning: 3 simulations have not completed yet\n')
+
+        work_queue.run_workers(self.directory.name, double, 2, 60, 0.1)
+        self.assertEqual(work_queue.collect(self.directory.name), [0, 2, 4])
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, 'metrics.json')))
+
+
+if __name__ == '__main__':
+    unittest.main()